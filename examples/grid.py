@@ -73,15 +73,15 @@ axis_indices = [(0, 1), (2, 3)]
 
 with Window(title='Oogli', width=width, height=height, major=major, minor=minor) as win:
     # Main Loop
-    triangle_data, triangle_indices = program.setup(vertices=triangle, indices=triangle_indices)
-    grid_data, grid_indices = program.setup(vertices=grid, indices=grid_indices)
-    axis_data, axis_indices = program.setup(vertices=axis, indices=axis_indices)
+    triangle_mesh = program.setup(vertices=triangle, indices=triangle_indices)
+    grid_mesh = program.setup(vertices=grid, indices=grid_indices)
+    axis_mesh = program.setup(vertices=axis, indices=axis_indices)
     while win.open is True:
         # Render triangle
         gl.clear(gl.COLOR_BUFFER_BIT | gl.DEPTH_BUFFER_BIT)
-        program.draw(mode=win.mode, fill=win.fill, data=triangle_data, indices=triangle_indices, color=green)
-        program.draw(mode=gl.LINES, fill=gl.LINE, data=axis_data, indices=axis_indices, color=yellow)
-        program.draw(mode=gl.LINES, fill=gl.LINE, data=grid_data, indices=grid_indices, color=grey)
+        program.draw(mode=win.mode, fill=win.fill, mesh=triangle_mesh, color=green)
+        program.draw(mode=gl.LINES, fill=gl.LINE, mesh=axis_mesh, color=yellow)
+        program.draw(mode=gl.LINES, fill=gl.LINE, mesh=grid_mesh, color=grey)
         # pixels = oogli.screenshot(win)
         win.cycle()
 
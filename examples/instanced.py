@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division
+
+import oogli
+from oogli import np
+from DebugWindow import DebugWindow as Window
+
+vshader = '''
+    #version 330
+    in vec3 vertices;
+    in vec3 colors;
+    in mat4 model;
+    out vec3 v_colors;
+    void main () {
+        gl_Position = model * vec4(vertices, 1.0);
+        v_colors = colors;
+    }
+'''
+
+fshader = '''
+    #version 330
+    in vec3 v_colors;
+    out vec4 frag_color;
+    void main () {
+        frag_color = vec4(v_colors, 1.0);
+    }
+'''
+
+program = oogli.Program(vshader, fshader)
+major, minor = program.version
+
+# Vertices for a 3D Cube
+pt = 0.5
+vertices = [
+    (-pt, pt, pt),
+    (pt, pt, pt),
+    (pt, -pt, pt),
+    (-pt, -pt, pt),
+    (-pt, pt, -pt),
+    (pt, pt, -pt),
+    (pt, -pt, -pt),
+    (-pt, -pt, -pt)
+]
+
+indices = [
+    (0, 1, 2), (2, 3, 0),  # front
+    (1, 5, 6), (6, 2, 1),  # top
+    (7, 6, 5), (5, 4, 7),  # back
+    (4, 0, 3), (3, 7, 4),  # bottom
+    (4, 5, 1), (1, 0, 4),  # left
+    (3, 2, 6), (6, 7, 3),  # right
+]
+
+colors = [
+    (1.0, 0.2, 0.2),
+    (1.0, 1.0, 0.2),
+    (1.0, 0.2, 1.0),
+    (0.2, 1.0, 0.2),
+    (0.2, 1.0, 1.0),
+    (0.2, 0.2, 1.0),
+    (0.2, 0.2, 0.2),
+    (1.0, 1.0, 1.0),
+]
+
+# A 100x100 grid of small cubes, one column-major transform per instance
+size = 100
+scale = 1 / size
+positions = np.linspace(-1 + scale, 1 - scale, size, dtype=np.float32)
+model = np.zeros((size * size, 4, 4), dtype=np.float32)
+model[:, 0, 0] = model[:, 1, 1] = model[:, 2, 2] = scale
+model[:, 3, 3] = 1.0
+model[:, 3, 0] = np.repeat(positions, size)
+model[:, 3, 1] = np.tile(positions, size)
+
+width, height = (640, 640)
+
+with Window('Oogli|Instanced Cubes', width=width, height=height, major=major, minor=minor) as win:
+    # Main Loop
+    program.load(vertices=vertices, indices=indices, colors=colors)
+    while win.open is True:
+        # Render every cube with a single draw call
+        oogli.gl.clear(oogli.gl.COLOR_BUFFER_BIT | oogli.gl.DEPTH_BUFFER_BIT)
+        program.draw_instanced(fill=win.fill, mode=win.mode, model=model)
+        win.cycle()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Compares the old per-pixel texture decode with textures.decode
+
+Run with a window or headless context available to include uploads:
+
+    PYOPENGL_PLATFORM=egl python texture_benchmark.py
+'''
+from __future__ import print_function
+
+import os
+import tempfile
+import time
+
+import oogli
+from oogli import gl, np
+from oogli.textures import decode
+from PIL import Image
+
+
+def timed(func, repeat=3):
+    '''Best time of a few runs'''
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        delta = time.time() - start
+        best = delta if best is None else min(best, delta)
+    return best, result
+
+
+def old_decode(path):
+    with Image.open(path) as image:
+        return np.array(list(image.getdata()), np.uint8)
+
+
+path = os.path.join(tempfile.mkdtemp(), '4k.png')
+pixels = np.random.randint(0, 255, size=(2160, 3840, 4)).astype(np.uint8)
+Image.fromarray(pixels, 'RGBA').save(path)
+
+old, _ = timed(lambda: old_decode(path), repeat=1)
+new, decoded = timed(lambda: decode(path))
+assert (decoded == pixels).all()
+print('decode  list: {:>8.3f} sec'.format(old))
+print('decode array: {:>8.3f} sec ({:.0f}x)'.format(new, old / new))
+
+if os.environ.get('PYOPENGL_PLATFORM') in ('egl', 'osmesa'):
+    ctx = oogli.Context(width=1, height=1)
+    texture = oogli.Texture(path)
+    texture.texture
+    for threshold, name in ((1 << 62, 'direct'), (1, 'unpack buffer')):
+        oogli.Texture.unpack_threshold = threshold
+        upload, _ = timed(lambda: (texture.upload(decoded), gl.finish()))
+        print('upload {:>13}: {:>8.3f} sec'.format(name, upload))
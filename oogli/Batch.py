@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import ctypes
+
+from glfw import gl
+import numpy as np
+
+from .buffers import Buffer, DirtyArray
+from .Mesh import Mesh
+from .state import State
+
+
+class Batch(object):
+    '''Packs many meshes of one program into a single vertex and index buffer
+
+    The packed meshes are drawn with one ``multi_draw_elements_base_vertex``
+    call, each mesh keeping its own indices through a base vertex offset.
+    If the vertex shader declares an input named ``draw_id`` it is filled
+    with each mesh's position in the batch, so per-mesh uniforms can be
+    passed as one indexed array:
+
+    >>> vshader = \'\'\'
+    ...     #version 150
+    ...     uniform vec3 color[3];
+    ...     in vec2 vertices;
+    ...     in float draw_id;
+    ...     out vec3 v_color;
+    ...     void main () {
+    ...         gl_Position = vec4(vertices, 0.0, 1.0);
+    ...         v_color = color[int(draw_id)];
+    ...     }
+    ... \'\'\'
+    >>> batch = program.batch([triangle_mesh, axis_mesh, grid_mesh])
+    >>> batch.draw(mode=gl.LINES, color=[green, yellow, grey])
+    '''
+
+    def __init__(self, program, meshes, draw_id='draw_id'):
+        self.program = program
+        meshes = list(meshes)
+        dtypes = set(mesh.data.data.dtype for mesh in meshes)
+        assert len(dtypes) == 1, 'Batched meshes must share a vertex layout: {}'.format(dtypes)
+        dtype = dtypes.pop()
+        assert dtype.names, 'Batched meshes need interleaved vertex records'
+        if draw_id in program.inputs and draw_id not in dtype.names:
+            dtype = np.dtype(dtype.descr + [(draw_id, np.float32)])
+        vertex_counts = [len(mesh.data.data) for mesh in meshes]
+        index_counts = [len(mesh.indices.data) for mesh in meshes]
+        data = np.zeros(sum(vertex_counts), dtype=dtype).view(DirtyArray)
+        indices = np.zeros(sum(index_counts), dtype=np.uint32).view(DirtyArray)
+        vertex_start, index_start = 0, 0
+        self.base_vertices = np.zeros(len(meshes), dtype=np.int32)
+        self.counts = np.array(index_counts, dtype=np.int32)
+        offsets = []
+        for draw_index, mesh in enumerate(meshes):
+            vertex_stop = vertex_start + len(mesh.data.data)
+            index_stop = index_start + len(mesh.indices.data)
+            rows = np.asarray(data[vertex_start:vertex_stop])
+            for name in mesh.data.data.dtype.names:
+                rows[name] = mesh.data.data[name]
+            if draw_id in dtype.names and draw_id not in mesh.data.data.dtype.names:
+                rows[draw_id] = draw_index
+            indices[index_start:index_stop] = mesh.indices.data
+            self.base_vertices[draw_index] = vertex_start
+            offsets.append(index_start * indices.itemsize)
+            vertex_start, index_start = vertex_stop, index_stop
+        # Byte offsets into the index buffer, passed as pointers
+        self.offsets = (ctypes.c_void_p * len(offsets))(*offsets)
+        State.current().bind_vertex_array(0)
+        data = Buffer(gl.gen_buffers(1), data)
+        indices = Buffer(gl.gen_buffers(1), indices)
+        data.upload(gl.ARRAY_BUFFER)
+        indices.upload(gl.ELEMENT_ARRAY_BUFFER)
+        self.mesh = Mesh(program, data, indices)
+
+    def draw(self, mode=gl.TRIANGLES, fill=gl.LINE, **kwds):
+        '''Draws every packed mesh with one call; keywords are uniforms'''
+        self.program.bind(fill=fill, **kwds)
+        self.mesh.bind()
+        gl.multi_draw_elements_base_vertex(
+            mode, self.counts, gl.UNSIGNED_INT, self.offsets, len(self.counts), self.base_vertices
+        )
+
+    def delete(self):
+        self.mesh.delete()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __repr__(self):
+        cname = self.__class__.__name__
+        count = len(self)
+        vertices = len(self.mesh.data.data)
+        string = '<{cname} meshes={count} vertices={vertices}>'.format(**locals())
+        return string
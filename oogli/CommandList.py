@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from glfw import gl
+import numpy as np
+
+from .Batch import Batch
+from .state import State, _toggle
+from .uniforms import UniformBlock
+
+
+class CommandList(object):
+    '''A recorded sequence of draws replayed with minimal Python overhead
+
+    Recording resolves program ids, vertex arrays, uniform setters and the
+    GL functions to call, and drops state changes made redundant by the
+    previous command.  Replaying is a loop over ``(function, args)``
+    pairs.  Uniform values are held in numpy arrays that can be patched
+    per draw (through the handle ``draw`` returns) or for every draw
+    (through ``replay`` keywords).
+
+    >>> commands = CommandList()
+    >>> commands.call(gl.clear, gl.COLOR_BUFFER_BIT | gl.DEPTH_BUFFER_BIT)
+    >>> triangle = commands.draw(program, mesh=triangle_mesh, color=green)
+    >>> commands.draw(program, mesh=grid_mesh, mode=gl.LINES, color=grey)
+    >>> while win.open:
+    ...     triangle['color'][:] = next(colors)
+    ...     commands.replay()
+    ...     win.cycle()
+    '''
+
+    def __init__(self):
+        self.commands = []
+        self.patches = {}
+        self.uniforms = set()
+        # State left behind by the commands, in State's format
+        self.final = {}
+
+    def call(self, func, *args):
+        '''Records an arbitrary call'''
+        self.commands.append((func, args))
+
+    def state(self, key, func, *args):
+        '''Records a state change unless the previous command set it'''
+        if self.final.get(key) != args:
+            self.call(func, *args)
+            self.final[key] = args
+
+    def draw(self, program, mesh=None, mode=gl.TRIANGLES, fill=gl.LINE, instances=None, **kwds):
+        '''Records a draw of a Program (or Batch); keywords are uniforms
+
+        Returns a dict of the uniform arrays used by this draw which may
+        be modified in place between replays.
+        '''
+        batch = program if isinstance(program, Batch) else None
+        if batch is not None:
+            program, mesh = batch.program, batch.mesh
+        else:
+            mesh = getattr(program, 'mesh', None) if mesh is None else mesh
+            assert mesh is not None, 'Load a mesh before recording a draw of it.'
+            mesh = program.load(mode=mode, fill=fill, data=mesh)
+        self.state(('polygon_mode', gl.FRONT_AND_BACK), gl.polygon_mode, gl.FRONT_AND_BACK, fill)
+        self.state(('capability', gl.DEPTH_TEST), _toggle, gl.DEPTH_TEST, True)
+        self.state('program', gl.use_program, program.program)
+        for name in program.blocks:
+            block = UniformBlock.registry.get(name)
+            if block is not None:
+                self.call(block.upload)
+        handle = {}
+        for varname, uniform in program.uniforms.items():
+            value = kwds.get(varname, getattr(program, varname, None))
+            if value is None or uniform.location == -1:
+                continue
+            value = np.array(value, dtype=uniform.dtype)
+            self.call(uniform.setter, value)
+            self.uniforms.add(uniform)
+            self.patches.setdefault(varname, []).append(value)
+            handle[varname] = value
+        self.state('vertex_array', gl.bind_vertex_array, mesh.vao)
+        # Uploads are no-ops unless the numpy data was modified
+        self.call(mesh.data.upload, gl.ARRAY_BUFFER)
+        self.call(mesh.indices.upload, gl.ELEMENT_ARRAY_BUFFER)
+        count = len(mesh.indices.data)
+        if batch is not None:
+            self.call(
+                gl.multi_draw_elements_base_vertex,
+                mode, batch.counts, gl.UNSIGNED_INT, batch.offsets, len(batch.counts), batch.base_vertices
+            )
+        elif instances is not None:
+            if mesh.instances is not None:
+                self.call(mesh.instances.upload, gl.ARRAY_BUFFER)
+            self.call(gl.draw_elements_instanced, mode, count, mesh.index_type, None, instances)
+        else:
+            self.call(gl.draw_elements, mode, count, mesh.index_type, None)
+        return handle
+
+    def replay(self, **kwds):
+        '''Issues every recorded command; keywords patch uniforms by name'''
+        for varname, value in kwds.items():
+            for array in self.patches.get(varname, ()):
+                np.copyto(array, value, casting='unsafe')
+        state = State.current()
+        # Vertex array binds below bypass the shadow state
+        state.values.pop(('buffer', gl.ELEMENT_ARRAY_BUFFER), None)
+        for func, args in self.commands:
+            func(*args)
+        state.values.update(self.final)
+        state.values.pop(('buffer', gl.ELEMENT_ARRAY_BUFFER), None)
+        for uniform in self.uniforms:
+            uniform.reset()
+
+    __call__ = replay
+
+    def clear(self):
+        '''Forgets every recorded command'''
+        del self.commands[:]
+        self.patches.clear()
+        self.uniforms.clear()
+        self.final.clear()
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __repr__(self):
+        cname = self.__class__.__name__
+        count = len(self)
+        string = '<{cname} commands={count}>'.format(**locals())
+        return string
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from glfw import gl
+import numpy as np
+
+from .state import State
+
+
+class Framebuffer(object):
+    '''Offscreen render target with a colour texture and a depth buffer
+
+    Rendering inside the ``with`` block (or via ``Program.draw(target=)``)
+    goes to the framebuffer at its own resolution, independent of any
+    window size.  The colour attachment is a texture (``color``) that can
+    be sampled by later passes or read back with ``read``.
+
+    >>> target = Framebuffer(3840, 2160)
+    >>> with target:
+    ...     target.clear()
+    ...     program.draw(vertices=triangle)
+    >>> pixels = target.read()
+    '''
+
+    def __init__(self, width, height, color=gl.RGBA8, depth=gl.DEPTH_COMPONENT24):
+        self.width = width
+        self.height = height
+        self.color_format = color
+        self.depth_format = depth
+        self.fbo = gl.gen_framebuffers(1)
+        self.color = None
+        self.depth = None
+        self.previous = []
+        self.allocate()
+
+    def allocate(self):
+        '''Creates the attachments at the current size'''
+        state = State.current()
+        previous = [state.values.get(('framebuffer', target), (target, 0))[-1]
+                    for target in (gl.DRAW_FRAMEBUFFER, gl.READ_FRAMEBUFFER)]
+        state.bind_framebuffer(gl.FRAMEBUFFER, self.fbo)
+        if self.color_format is not None:
+            if self.color is None:
+                self.color = gl.gen_textures(1)
+            state.bind_texture(gl.TEXTURE_2D, self.color)
+            gl.tex_image_2d(gl.TEXTURE_2D, 0, self.color_format, self.width, self.height, 0, gl.RGBA, gl.UNSIGNED_BYTE, None)
+            gl.tex_parameteri(gl.TEXTURE_2D, gl.TEXTURE_MIN_FILTER, gl.LINEAR)
+            gl.tex_parameteri(gl.TEXTURE_2D, gl.TEXTURE_MAG_FILTER, gl.LINEAR)
+            gl.framebuffer_texture_2d(gl.FRAMEBUFFER, gl.COLOR_ATTACHMENT0, gl.TEXTURE_2D, self.color, 0)
+        if self.depth_format is not None:
+            if self.depth is None:
+                self.depth = gl.gen_renderbuffers(1)
+            gl.bind_renderbuffer(gl.RENDERBUFFER, self.depth)
+            gl.renderbuffer_storage(gl.RENDERBUFFER, self.depth_format, self.width, self.height)
+            gl.framebuffer_renderbuffer(gl.FRAMEBUFFER, gl.DEPTH_ATTACHMENT, gl.RENDERBUFFER, self.depth)
+            gl.bind_renderbuffer(gl.RENDERBUFFER, 0)
+        status = gl.check_framebuffer_status(gl.FRAMEBUFFER)
+        # Leaves whatever was bound before (e.g. a headless context's target)
+        state.bind_framebuffer(gl.DRAW_FRAMEBUFFER, previous[0])
+        state.bind_framebuffer(gl.READ_FRAMEBUFFER, previous[1])
+        assert status == gl.FRAMEBUFFER_COMPLETE, 'Incomplete framebuffer: {}'.format(status)
+
+    def resize(self, width, height):
+        '''Reallocates the attachments at a new size'''
+        if (width, height) != (self.width, self.height):
+            self.width, self.height = width, height
+            self.allocate()
+
+    def bind(self, x=0, y=0, width=None, height=None):
+        '''Directs rendering here; the viewport can select a tile'''
+        state = State.current()
+        state.bind_framebuffer(gl.FRAMEBUFFER, self.fbo)
+        width = self.width if width is None else width
+        height = self.height if height is None else height
+        state.viewport(x, y, width, height)
+
+    def __enter__(self):
+        state = State.current()
+        framebuffer = state.values.get(('framebuffer', gl.DRAW_FRAMEBUFFER), (gl.DRAW_FRAMEBUFFER, 0))[-1]
+        viewport = state.values.get('viewport') or tuple(int(v) for v in gl.get_integerv(gl.VIEWPORT))
+        self.previous.append((framebuffer, viewport))
+        self.bind()
+        return self
+
+    def __exit__(self, *args, **kwds):
+        framebuffer, viewport = self.previous.pop()
+        state = State.current()
+        state.bind_framebuffer(gl.FRAMEBUFFER, framebuffer)
+        state.viewport(*viewport)
+
+    def clear(self, color=(0.0, 0.0, 0.0, 1.0), bits=None):
+        '''Clears the attachments; must be bound'''
+        State.current().clear_color(*color)
+        gl.clear(bits or (gl.COLOR_BUFFER_BIT | gl.DEPTH_BUFFER_BIT))
+
+    def read(self, pixels=None, fmt=gl.RGB, x=0, y=0, width=None, height=None):
+        '''Reads back the colour attachment (or a region of it)'''
+        width = self.width if width is None else width
+        height = self.height if height is None else height
+        components = 4 if fmt in (gl.RGBA, gl.BGRA) else 3
+        if not isinstance(pixels, np.ndarray):
+            pixels = np.zeros((height, width, components), dtype=np.uint8)
+        state = State.current()
+        previous = state.values.get(('framebuffer', gl.READ_FRAMEBUFFER), (gl.READ_FRAMEBUFFER, 0))[-1]
+        state.bind_framebuffer(gl.READ_FRAMEBUFFER, self.fbo)
+        gl.pixel_storei(gl.PACK_ALIGNMENT, 1)
+        pixels = gl.read_pixels(x, y, width, height, fmt, gl.UNSIGNED_BYTE, pixels)
+        state.bind_framebuffer(gl.READ_FRAMEBUFFER, previous)
+        return pixels
+
+    def delete(self):
+        '''Frees the framebuffer and its attachments'''
+        state = State.current()
+        for target in (gl.DRAW_FRAMEBUFFER, gl.READ_FRAMEBUFFER):
+            # Deleting a bound framebuffer reverts that binding to 0; any
+            #  other binding (e.g. a headless context's target) stays
+            if state.values.get(('framebuffer', target), (target, 0))[-1] == self.fbo:
+                state.bind_framebuffer(target, 0)
+        if self.color is not None:
+            state.unbind_texture(self.color)
+            gl.delete_textures([self.color])
+        if self.depth is not None:
+            gl.delete_renderbuffers(1, [self.depth])
+        gl.delete_framebuffers(1, [self.fbo])
+        self.color = self.depth = None
+
+    def __repr__(self):
+        cname = self.__class__.__name__
+        fbo, width, height = self.fbo, self.width, self.height
+        string = '<{cname}:{fbo} {width}x{height}>'.format(**locals())
+        return string
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import ctypes
+
+from glfw import gl
+import numpy as np
+
+from .buffers import Buffer, DirtyArray, pointers
+from .state import State
+
+
+# numpy component type -> OpenGL attribute type
+gl_types = {
+    np.dtype(np.float32): gl.FLOAT,
+    np.dtype(np.float16): gl.HALF_FLOAT,
+    np.dtype(np.float64): gl.DOUBLE,
+    np.dtype(np.int8): gl.BYTE,
+    np.dtype(np.uint8): gl.UNSIGNED_BYTE,
+    np.dtype(np.int16): gl.SHORT,
+    np.dtype(np.uint16): gl.UNSIGNED_SHORT,
+    np.dtype(np.int32): gl.INT,
+    np.dtype(np.uint32): gl.UNSIGNED_INT,
+}
+
+
+def integer_input(vartype):
+    '''True for GLSL input types read as integers (int, uvec3...)'''
+    return vartype in ('int', 'uint') or str(vartype).startswith(('ivec', 'uvec'))
+
+
+class Mesh(object):
+    '''Vertex and index buffers with their attribute layout baked into a VAO
+
+    The layout is recorded once when the mesh is created, so drawing is a
+    single vertex array bind followed by ``draw_elements``.  A mesh unpacks
+    into its ``(data, indices)`` buffers for code that expects them.
+
+    >>> mesh = program.setup(vertices=triangle, indices=[0, 1, 2])
+    >>> program.draw(mesh=mesh)
+    '''
+
+    def __init__(self, program, data, indices, attributes=None):
+        '''``attributes`` maps inputs to their buffers.Pointer; by default
+        they are the fields of the structured vertex data'''
+        self.program = program
+        self.data = data
+        self.indices = indices
+        self.attributes = pointers(data.data.dtype) if attributes is None else attributes
+        self.instances = None
+        self.vao = gl.gen_vertex_arrays(1)
+        self.bake()
+
+    def bake(self):
+        '''Records attribute pointers and the index buffer into the VAO'''
+        state = State.current()
+        state.bind_vertex_array(self.vao)
+        state.bind_buffer(gl.ARRAY_BUFFER, self.data.id)
+        for varname in self.program.inputs:
+            if varname not in self.attributes:
+                continue
+            loc = self.program.inputs[varname].location
+            vartype = self.program.inputs[varname].vartype
+            pointer = self.attributes[varname]
+            gl_type = gl_types[pointer.dtype]
+            offset = ctypes.c_void_p(pointer.offset)
+            gl.enable_vertex_attrib_array(loc)
+            if integer_input(vartype):
+                # Integers reach int/uint inputs unconverted
+                error_message = 'Input {} ({}) needs integer data, not {}'.format(varname, vartype, pointer.dtype)
+                assert pointer.dtype.kind in 'iu', error_message
+                gl.vertex_attrib_ipointer(loc, pointer.components, gl_type, pointer.stride, offset)
+            else:
+                gl.vertex_attrib_pointer(loc, pointer.components, gl_type, pointer.normalized, pointer.stride, offset)
+        state.bind_buffer(gl.ELEMENT_ARRAY_BUFFER, self.indices.id)
+        state.bind_vertex_array(0)
+
+    def instance(self, **arrays):
+        '''Sets per-instance attributes from numpy arrays
+
+        Each array's first axis is the instance; an (N, 4, 4) array feeds a
+        ``mat4`` input over four consecutive locations.  Unchanged arrays
+        cost nothing, changed ones are re-sent on the next draw.
+
+        Returns the number of instances.
+        '''
+        arrays = dict((name, np.asarray(val, dtype=np.float32)) for name, val in arrays.items())
+        count = min(len(val) for val in arrays.values())
+        dtype = np.dtype([(name, np.float32, val.shape[1:]) for name, val in sorted(arrays.items())])
+        instances = self.instances
+        if instances is not None and instances.data.dtype == dtype and len(instances.data) == count:
+            for name, val in arrays.items():
+                if not np.array_equal(instances.data[name], val[:count]):
+                    instances.data[name] = val[:count]
+            return count
+        data = np.zeros(count, dtype=dtype).view(DirtyArray)
+        for name, val in arrays.items():
+            data[name] = val[:count]
+        buffer_id = gl.gen_buffers(1) if instances is None else instances.id
+        self.instances = Buffer(buffer_id, data)
+        if instances is None or instances.data.dtype != dtype:
+            self.bake_instances()
+        return count
+
+    def bake_instances(self):
+        '''Records per-instance attribute pointers and divisors'''
+        dtype = self.instances.data.dtype
+        stride = dtype.itemsize
+        state = State.current()
+        state.bind_vertex_array(self.vao)
+        state.bind_buffer(gl.ARRAY_BUFFER, self.instances.id)
+        for varname in dtype.names:
+            if varname not in self.program.inputs:
+                continue
+            loc = self.program.inputs[varname].location
+            field_type, offset = dtype.fields[varname][:2]
+            shape = field_type.shape or (1, )
+            # Matrices take one location per column
+            columns, size = shape if len(shape) == 2 else (1, shape[0])
+            for column in range(columns):
+                column_offset = offset + column * size * field_type.base.itemsize
+                gl.enable_vertex_attrib_array(loc + column)
+                gl.vertex_attrib_pointer(loc + column, size, gl.FLOAT, False, stride, ctypes.c_void_p(column_offset))
+                gl.vertex_attrib_divisor(loc + column, 1)
+        state.bind_vertex_array(0)
+
+    @property
+    def index_type(self):
+        '''GL type of the indices: unsigned byte, short or int'''
+        return gl_types[self.indices.data.dtype]
+
+    def bind(self):
+        '''Binds the VAO and uploads any modified vertex or index data'''
+        State.current().bind_vertex_array(self.vao)
+        # These are no-ops unless the numpy data was modified
+        self.data.upload(gl.ARRAY_BUFFER)
+        self.indices.upload(gl.ELEMENT_ARRAY_BUFFER)
+
+    def draw(self, mode=gl.TRIANGLES, instances=None):
+        '''Binds the VAO and draws every index, optionally instanced'''
+        self.bind()
+        if instances is None:
+            gl.draw_elements(mode, len(self.indices.data), self.index_type, None)
+        else:
+            if self.instances is not None:
+                self.instances.upload(gl.ARRAY_BUFFER)
+            gl.draw_elements_instanced(mode, len(self.indices.data), self.index_type, None, instances)
+
+    def delete(self):
+        '''Releases the VAO and buffers'''
+        gl.delete_vertex_arrays(1, [self.vao])
+        gl.delete_buffers(2, [self.data.id, self.indices.id])
+        if self.instances is not None:
+            gl.delete_buffers(1, [self.instances.id])
+        # Deleted names are recycled by OpenGL
+        State.current().reset()
+
+    def __iter__(self):
+        yield self.data
+        yield self.indices
+
+    def __len__(self):
+        return len(self.indices.data)
+
+    def __repr__(self):
+        cname = self.__class__.__name__
+        vao = self.vao
+        count = len(self)
+        string = '<{cname}:{vao} indices={count}>'.format(**locals())
+        return string
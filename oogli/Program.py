@@ -1,13 +1,18 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import ctypes
 from collections import OrderedDict, namedtuple
-
-Buffer = namedtuple('Buffer', ['id', 'data'])
+import hashlib
+import os
+import struct
 
 from glfw import gl
 import numpy as np
 
+from . import context
+from .Batch import Batch
+from .buffers import Buffer, DirtyArray, pointers, vertex_view
+from .Mesh import Mesh, integer_input
+from .state import State
 from .shaders import (
     Shader,
     VertexShader,
@@ -16,7 +21,10 @@ from .shaders import (
     TessellationControlShader,
     TessellationEvaluationShader,
 )
-from .utils import uniform_mapping
+from .uniforms import Uniform, UniformBlock
+from .utils import uniform_names
+
+Attribute = namedtuple('Attribute', ['name', 'location', 'size', 'vartype'])
 
 
 def array(val, vtype=np.float32):
@@ -38,6 +46,15 @@ def array(val, vtype=np.float32):
 
 
 class Program(object):
+    '''A linked set of shaders
+
+    Programs built from the same sources in the same context share their
+    shaders and their linked GL program, which is deleted once every
+    Program using it has been deleted.
+    '''
+
+    # (State, (shader type, source), ...) -> shared linked program
+    linked = {}
 
     @property
     def version(self):
@@ -45,21 +62,27 @@ class Program(object):
         return version
 
     def __init__(self, vert=None, frag=None, geo=None, tc=None, te=None):
-        self.vert = VertexShader(vert) if vert is not None else None
-        self.frag = FragmentShader(frag) if frag is not None else None
-        self.tc = TessellationControlShader(tc) if tc is not None else None
-        self.te = TessellationEvaluationShader(te) if te is not None else None
-        self.geo = GeometryShader(geo) if geo is not None else None
+        self.vert = VertexShader.acquire(vert) if vert is not None else None
+        self.frag = FragmentShader.acquire(frag) if frag is not None else None
+        self.tc = TessellationControlShader.acquire(tc) if tc is not None else None
+        self.te = TessellationEvaluationShader.acquire(te) if te is not None else None
+        self.geo = GeometryShader.acquire(geo) if geo is not None else None
+        self.shared = [s for s in (self.vert, self.frag, self.tc, self.te, self.geo) if s is not None]
+        self.key = None
         self.loaded = False
         self.built = False
         self.created = False
         self.inputs = OrderedDict()
         self.uniforms = OrderedDict()
+        self.blocks = OrderedDict()
+        self.meshes = {}
 
     @property
     def program(self):
         if not hasattr(self, '_program'):
             self._program = gl.create_program()
+            # The context the program belongs to
+            self.owner = State.current()
             self.created = True
         return self._program
 
@@ -91,54 +114,194 @@ class Program(object):
             for shader in (self.vert, self.frag, self.tc, self.te, self.geo)
             if isinstance(shader, Shader)
         ]
-        program_id = self.program
-        assert program_id != 0
         error_message = 'Both a vertex and fragment shader must be provided.'
         assert len(shaders) >= 2, error_message
         assert self.vert is not None and self.frag is not None, error_message
-        # Attach Shaders
-        for shader in shaders:
-            if isinstance(shader, Shader):
-                self.attach(shader)
-                for varname in shader:
-                    val = shader[varname]
-                    if isinstance(val, (tuple, list)) and val[0] == 'uniform':
-                        self.uniforms[varname] = shader
-
-        # Link Shaders
-        gl.link_program(program_id)
-        # Check for errors
-        result = gl.get_programiv(program_id, gl.LINK_STATUS)
-        log_length = gl.get_programiv(program_id, gl.INFO_LOG_LENGTH)
-        log = ''
-        if log_length != 0:
-            log = gl.get_program_info_log(program_id)
-        if log.strip():
-            assert result == gl.TRUE and log_length == 0, log
-        self.inputs = OrderedDict((k, v) for k, v in self.vert.inputs.items())
-        # Cleanup shaders
+        self.key = (State.current(), ) + tuple((shader.opengl_type, shader.source) for shader in shaders)
+        shared = Program.linked.get(self.key)
+        if shared is not None:
+            # Identical sources were already linked in this context
+            shared['references'] += 1
+            self._program = shared['program']
+            self.owner = self.key[0]
+            self.created = True
+            self.inputs = shared['inputs']
+            self.uniforms = shared['uniforms']
+            self.blocks = shared['blocks']
+            self.built = True
+            return
+        program_id = self.program
+        assert program_id != 0
+        path = self.binary_path(shaders)
+        if not self.load_binary(path):
+            # Attach Shaders
+            for shader in shaders:
+                if isinstance(shader, Shader):
+                    self.attach(shader)
+            if path is not None:
+                gl.program_parameteri(program_id, gl.PROGRAM_BINARY_RETRIEVABLE_HINT, gl.TRUE)
+
+            # Link Shaders
+            gl.link_program(program_id)
+            # Check for errors
+            result = gl.get_programiv(program_id, gl.LINK_STATUS)
+            log_length = gl.get_programiv(program_id, gl.INFO_LOG_LENGTH)
+            log = ''
+            if log_length != 0:
+                log = gl.get_program_info_log(program_id)
+            if log.strip():
+                assert result == gl.TRUE and log_length == 0, log
+            # Cleanup shaders
+            for shader in shaders:
+                if isinstance(shader, Shader):
+                    shader.cleanup(program=self)
+            self.save_binary(path)
+        self.reflect()
+        # Link uniform blocks to their shared binding points
         for shader in shaders:
-            if isinstance(shader, Shader):
-                shader.cleanup(program=self)
-        # Bind the attributes based on their index in bound_attributes
-        for index, varname in enumerate(self.inputs):
-            gl.bind_attrib_location(program_id, index, varname)
-        # Bind the uniforms based on their index in bound_attributes
-        for index, varname in enumerate(self.uniforms):
-            shader = self.uniforms[varname]
-            vardata = shader[varname]
-            loc = gl.get_uniform_location(self.program, varname)
-            vartype = vardata[1]
-            mapping = uniform_mapping[vartype]
-            if vartype.startswith('vec'):
-                uniform_binder = lambda data: mapping(loc, *array(data, vartype))
-            elif vartype.startswith('mat'):
-                # Different pattern
-                uniform_binder = lambda data: mapping(loc, 1, gl.FALSE, array(data, vartype))
-            self.uniforms[varname] = uniform_binder
+            for name in shader.blocks:
+                index = gl.get_uniform_block_index(program_id, name)
+                if index != gl.INVALID_INDEX:
+                    self.blocks[name] = UniformBlock.binding_point(name)
+                    gl.uniform_block_binding(program_id, index, self.blocks[name])
+        Program.linked[self.key] = {
+            'program': program_id,
+            'inputs': self.inputs,
+            'uniforms': self.uniforms,
+            'blocks': self.blocks,
+            'references': 1,
+        }
         self.built = True
 
-    def setup(self, indices=[], data=[], **kwds):
+    def delete(self):
+        '''Releases this program's share of its GL program and shaders'''
+        shared = Program.linked.get(getattr(self, 'key', None))
+        if shared is not None and shared['program'] == getattr(self, '_program', None):
+            shared['references'] -= 1
+            if shared['references'] <= 0:
+                del Program.linked[self.key]
+                self.owner.discard(gl.delete_program, shared['program'])
+        elif hasattr(self, '_program'):
+            self.owner.discard(gl.delete_program, self._program)
+        if hasattr(self, '_program'):
+            del self._program
+        self.key = None
+        self.built = False
+        for shader in getattr(self, 'shared', ()):
+            shader.release()
+        self.shared = []
+
+    def __del__(self):
+        self.delete()
+
+    def binary_path(self, shaders):
+        '''Cache file for the linked program, or None if caching is off
+
+        Files live in ``context.cache_dir`` and are named by a hash of
+        every stage's source and the driver, so a driver update or a
+        source change never picks up a stale binary.
+        '''
+        if not context.cache_dir or not bool(gl.get_program_binary):
+            return None
+        digest = hashlib.sha1(context.driver().encode('utf-8'))
+        for shader in shaders:
+            digest.update('{}\n{}\n'.format(shader.opengl_type, shader.source).encode('utf-8'))
+        return os.path.join(context.cache_dir, 'programs', '{}.bin'.format(digest.hexdigest()))
+
+    def load_binary(self, path):
+        '''Links the program from a cached binary
+
+        Returns False when there is no binary or the driver rejects it.
+        '''
+        if path is None or not os.path.exists(path):
+            return False
+        with open(path, 'rb') as fd:
+            blob = fd.read()
+        if len(blob) < 4:
+            # Truncated or empty file
+            return False
+        binary_format, = struct.unpack('<I', blob[:4])
+        binary = np.frombuffer(blob[4:], dtype=np.uint8)
+        try:
+            gl.program_binary(self.program, binary_format, binary, len(binary))
+        except gl.GLError:
+            # A format this driver does not support (updated driver, or a
+            #  cache shared between GPUs)
+            return False
+        return gl.get_programiv(self.program, gl.LINK_STATUS) == gl.TRUE
+
+    def save_binary(self, path):
+        '''Stores the linked program's binary at path'''
+        if path is None:
+            return
+        length = gl.get_programiv(self.program, gl.PROGRAM_BINARY_LENGTH)
+        if not length:
+            return
+        binary = np.empty(length, dtype=np.uint8)
+        binary_format = np.zeros(1, dtype=np.uint32)
+        written = np.zeros(1, dtype=np.int32)
+        gl.get_program_binary(self.program, length, written, binary_format, binary)
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        # Write then rename so concurrent processes never read half a file
+        temp = '{}.{}'.format(path, os.getpid())
+        with open(temp, 'wb') as fd:
+            fd.write(struct.pack('<I', int(binary_format[0])))
+            fd.write(binary[:int(written[0])].tobytes())
+        os.rename(temp, path)
+
+    def reflect(self):
+        '''Fills inputs and uniforms from the linked program
+
+        Only what the linker kept is reported, with real locations, array
+        sizes and types, so declarations hidden behind ``#ifdef`` or
+        optimized out are handled exactly.  Each uniform gets its typed
+        setter resolved here, once.
+        '''
+        program_id = self.program
+        inputs = []
+        for index in range(gl.get_programiv(program_id, gl.ACTIVE_ATTRIBUTES)):
+            name, size, vartype = gl.get_active_attrib(program_id, index)
+            name = name.decode('utf-8') if isinstance(name, bytes) else name
+            if name.startswith('gl_'):
+                continue
+            location = gl.get_attrib_location(program_id, name)
+            inputs.append(Attribute(name, location, size, uniform_names.get(vartype, vartype)))
+        self.inputs = OrderedDict((attribute.name, attribute) for attribute in sorted(inputs, key=lambda a: a.location))
+        self.uniforms = OrderedDict()
+        for index in range(gl.get_programiv(program_id, gl.ACTIVE_UNIFORMS)):
+            name, size, vartype = gl.get_active_uniform(program_id, index)
+            name = name.decode('utf-8') if isinstance(name, bytes) else name
+            if name.startswith('gl_') or vartype not in uniform_names:
+                continue
+            if name.endswith('[0]'):
+                name = name[:-len('[0]')]
+            location = gl.get_uniform_location(program_id, name)
+            if location == -1:
+                # Members of uniform blocks have no location
+                continue
+            self.uniforms[name] = Uniform(program_id, name, uniform_names[vartype], size, location=location)
+
+    def setup(self, indices=[], data=[], layout=None, planar=False, normalized=None, **kwds):
+        '''Uploads vertex data and indices into a Mesh
+
+        Vertex inputs come from keywords, which are interleaved into a
+        new array, or from ``data``.  With a ``layout`` (one vertex as a
+        numpy dtype) ``data`` may be any buffer -- bytes, memoryview,
+        array.array, an ndarray or np.memmap -- holding interleaved
+        records, or ``planar`` blocks of each field in turn; it is
+        uploaded in place with no intermediate copy.  ``indices`` may
+        likewise be a buffer; uint8, uint16 and uint32 indices are used
+        as they are, anything else is copied to uint32.
+
+        ``normalized`` maps inputs to whether their integer data is
+        normalized for float inputs (see ``buffers.pointers``); int and
+        uint inputs always read integers unconverted.
+
+        >>> data = np.memmap('city.bin', mode='r')
+        >>> mesh = program.setup(data=data, layout=[('vertices', 'f4', 3), ('normals', 'f4', 3)], planar=True)
+        '''
         if not self.built:
             try:
                 self.build()
@@ -147,23 +310,40 @@ class Program(object):
                 for arg in e.args:
                     print(arg)
             self.built = True
+        if isinstance(data, Mesh):
+            return data
         if isinstance(data, Buffer) and isinstance(indices, Buffer):
-            return data, indices
+            key = (data.id, indices.id)
+            if key not in self.meshes:
+                self.meshes[key] = Mesh(self, data, indices)
+            return self.meshes[key]
 
-        if data and not isinstance(data, Buffer):
-            if isinstance(data, (tuple, list)):
-                data = np.array(data, dtype='f')
+        data, indices, attributes = self.arrays(indices, data, layout, planar, normalized, **kwds)
+        return self.upload(data, indices, attributes)
 
-        data_len = len(data)
+    def arrays(self, indices=[], data=[], layout=None, planar=False, normalized=None, **kwds):
+        '''Vertex data, indices and attribute pointers for setup'''
+        attributes = None
+        if layout is not None:
+            data, attributes, data_len = vertex_view(data, layout, planar, normalized)
+        else:
+            if isinstance(data, (tuple, list)) and data:
+                data = np.array(data, dtype='f')
+            data_len = len(data)
         if data_len == 0:
             interleaved = OrderedDict()
-            for key in self.inputs.keys() + self.uniforms.keys():
+            for key in list(self.inputs) + list(self.uniforms):
                 if key in kwds:
                     val = kwds[key]
                     if key in self.uniforms:
                         setattr(self, key, val)
                     else:
-                        interleaved[key] = val if isinstance(val, np.ndarray) else array(val)
+                        # Lists feeding int and uint inputs stay integers
+                        vartype = str(self.inputs[key].vartype)
+                        vtype = np.float32
+                        if integer_input(vartype):
+                            vtype = np.uint32 if vartype.startswith('u') else np.int32
+                        interleaved[key] = val if isinstance(val, np.ndarray) else array(val, vtype=vtype)
                         data_len = len(interleaved[key])
                         setattr(self.vert, key, val)
             data_buffer = np.zeros(
@@ -173,20 +353,32 @@ class Program(object):
             for key, val in interleaved.items():
                 data_buffer[key] = val
             data = data_buffer
+        if attributes is None and normalized:
+            attributes = pointers(data.dtype, normalized=normalized)
 
         if isinstance(indices, list) and not indices:
             indices = range(data_len)
+        if isinstance(indices, (bytes, bytearray, memoryview)) or hasattr(indices, 'typecode'):
+            # Viewed in place like vertex buffers
+            indices = np.frombuffer(indices, dtype=getattr(indices, 'typecode', np.uint32))
         if not isinstance(indices, np.ndarray):
             indices = array(indices, vtype=np.uint32)
-        indices = indices.flatten()
-
-        data_id = gl.gen_buffers(1)
-        indices_id = gl.gen_buffers(1)
+        if indices.dtype not in (np.uint8, np.uint16, np.uint32):
+            indices = indices.astype(np.uint32)
+        return data, indices.ravel(), attributes
 
-        gl.bind_buffer(gl.ARRAY_BUFFER, data_id)
-        gl.bind_buffer(gl.ELEMENT_ARRAY_BUFFER, indices_id)
-        gl.buffer_data(gl.ELEMENT_ARRAY_BUFFER, indices.nbytes, indices.flatten(), gl.STATIC_DRAW)
-        return Buffer(data_id, data), Buffer(indices_id, indices)
+    def upload(self, data, indices, attributes=None):
+        '''Creates a Mesh with new buffers holding data and indices'''
+        # Upload once; afterwards only modified bytes are re-sent by draw.
+        #  No VAO may be bound or it would capture the index buffer.
+        State.current().bind_vertex_array(0)
+        data = Buffer(gl.gen_buffers(1), data.view(DirtyArray))
+        indices = Buffer(gl.gen_buffers(1), indices.view(DirtyArray))
+        data.upload(gl.ARRAY_BUFFER)
+        indices.upload(gl.ELEMENT_ARRAY_BUFFER)
+        mesh = Mesh(self, data, indices, attributes)
+        self.meshes[(data.id, indices.id)] = mesh
+        return mesh
 
     def load(self, mode=gl.TRIANGLES, fill=gl.LINE, indices=[], data=[], bits=None, **kwds):
         if not self.built:
@@ -197,64 +389,103 @@ class Program(object):
                 for arg in e.args:
                     print(arg)
             self.built = True
-        if not isinstance(indices, np.ndarray) or not isinstance(data, np.ndarray):
+        if isinstance(data, (Mesh, Buffer)):
+            return self.setup(indices=indices, data=data)
+        # Only (re)load when new vertex data shows up
+        if len(data) or len(indices) or any(key in self.inputs for key in kwds):
             self.loaded = False
         if not self.loaded:
             self.loaded = True
             self.bits = bits or (gl.COLOR_BUFFER_BIT | gl.DEPTH_BUFFER_BIT)
             self.mode = mode
             self.fill = fill
+            self.mesh = self.reload(indices=indices, data=data, **kwds)
+        return self.mesh
 
-            self.vao = gl.gen_vertex_arrays(1)
+    def reload(self, indices=[], data=[], layout=None, planar=False, normalized=None, **kwds):
+        '''Refills the loaded mesh in place when new vertex data keeps its
+        layout and length; otherwise frees it and sets up a new one'''
+        mesh = getattr(self, 'mesh', None)
+        if mesh is None:
+            return self.setup(indices=indices, data=data, layout=layout, planar=planar, normalized=normalized, **kwds)
+        data, indices, attributes = self.arrays(indices, data, layout, planar, normalized, **kwds)
+        pairs = ((mesh.data.data, data), (mesh.indices.data, indices))
+        same = all(
+            old.dtype == new.dtype and old.shape == new.shape and old.flags.writeable
+            for old, new in pairs
+        )
+        if same and mesh.attributes == (pointers(data.dtype) if attributes is None else attributes):
+            for old, new in pairs:
+                # Unchanged data stays clean and is not re-sent
+                if not np.array_equal(old, new):
+                    old[...] = new
+            return mesh
+        self.meshes.pop((mesh.data.id, mesh.indices.id), None)
+        mesh.delete()
+        return self.upload(data, indices, attributes)
 
-            data, indices = self.setup(indices=indices, data=data, **kwds)
-            self.buffer = data
-            self.indices = indices
+    def batch(self, meshes, **kwds):
+        '''Packs meshes into a Batch drawn with a single call'''
+        return Batch(self, meshes, **kwds)
 
-        if isinstance(indices, list) and indices == []:
-            indices = self.indices
-        if isinstance(data, list) and data == []:
-            data = self.buffer
-        return data, indices
+    def bind(self, fill=None, **kwds):
+        '''Makes the program current and uploads changed uniforms'''
+        state = State.current()
+        state.polygon_mode(gl.FRONT_AND_BACK, fill or self.fill)
+        state.enable(gl.DEPTH_TEST)
+        # gl.depth_func(gl.LESS)
+        state.use_program(self.program)
+        for name in self.blocks:
+            block = UniformBlock.registry.get(name)
+            if block is not None:
+                block.upload()
+        for varname, uniform in self.uniforms.items():
+            value = kwds.get(varname, getattr(self, varname, None))
+            if value is not None:
+                uniform(value)
 
-    def draw(self, mode=gl.TRIANGLES, fill=gl.LINE, indices=[], data=[], **kwds):
+    def draw(self, mode=gl.TRIANGLES, fill=gl.LINE, indices=[], data=[], mesh=None, target=None, **kwds):
         '''Converts list data into array data and binds numpy arrays to
-        vertex shader inputs.'''
-        if isinstance(data, list) and data or isinstance(indices, list) and indices:
-            self.loaded = False
-        data, indices = self.load(mode=mode, fill=fill, indices=indices, data=data, **kwds)
-        # Setup for drawing
-        gl.polygon_mode(gl.FRONT_AND_BACK, fill or self.fill)
-        gl.enable(gl.DEPTH_TEST)
-        # gl.depth_func(gl.LESS)
-        gl.use_program(self.program)
-
-        gl.bind_vertex_array(self.vao)
-        gl.buffer_data(gl.ARRAY_BUFFER, data.data.nbytes, data.data, gl.DYNAMIC_DRAW)
-        stride = data.data.strides[0]
-
-        last_varname = None
-        for varindex, vardata in enumerate(self.inputs.items()):
-            varname, vartype = vardata
-            if last_varname is None:
-                offset = None
-                last_varname = varname
-            else:
-                offset = data.data.dtype[last_varname].itemsize
-            loc = gl.glGetAttribLocation(self.program, varname)
-            offset_wrapped = ctypes.c_void_p(offset)
-            gl.enable_vertex_attrib_array(loc)
-            gl.bind_buffer(gl.ELEMENT_ARRAY_BUFFER, indices.id)
-            gl.vertex_attrib_pointer(loc, data.data[varname].shape[-1], gl.FLOAT, False, stride, offset_wrapped)
-        for varname, binder in self.uniforms.items():
-            vardata = kwds.get(varname, getattr(self, varname, None))
-            if vardata:
-                binder(vardata)
-        mode = mode or self.mode
-        index_count = len(indices.data)
-        gl.draw_elements(mode, index_count, gl.UNSIGNED_INT, None)
-        # gl.disable_vertex_attrib_array(self.vao)
-        return data, indices
+        vertex shader inputs.  A Framebuffer ``target`` receives the
+        rendering instead of the window.'''
+        mesh = self.load(mode=mode, fill=fill, indices=indices, data=data if mesh is None else mesh, **kwds)
+        if target is not None:
+            with target:
+                return self.draw(mode=mode, fill=fill, mesh=mesh, **kwds)
+        self.bind(fill=fill, **kwds)
+        mesh.draw(mode or self.mode)
+        return mesh
+
+    def draw_instanced(self, instances=None, mode=gl.TRIANGLES, fill=gl.LINE, mesh=None, target=None, **kwds):
+        '''Draws many copies of a mesh with a single draw call
+
+        Vertex shader inputs that are not part of the mesh's vertex data
+        are read per instance from numpy arrays whose first axis is the
+        instance, e.g. an (N, 4, 4) float32 array for ``in mat4 model``.
+        Remaining keywords are uniforms.
+
+        >>> program.load(vertices=cube, indices=cube_indices)
+        >>> program.draw_instanced(model=transforms, mvp=projection)
+        '''
+        mesh = getattr(self, 'mesh', None) if mesh is None else mesh
+        assert mesh is not None, 'Load a mesh before drawing instances of it.'
+        mesh = self.load(mode=mode, fill=fill, data=mesh)
+        vertex_inputs = mesh.attributes
+        arrays = dict(
+            (key, kwds.pop(key))
+            for key in list(kwds)
+            if key in self.inputs and key not in vertex_inputs
+        )
+        count = mesh.instance(**arrays) if arrays else 1
+        instances = count if instances is None else instances
+        if target is not None:
+            with target:
+                self.bind(fill=fill, **kwds)
+                mesh.draw(mode or self.mode, instances=instances)
+            return mesh
+        self.bind(fill=fill, **kwds)
+        mesh.draw(mode or self.mode, instances=instances)
+        return mesh
 
     def __repr__(self):
         cname = self.__class__.__name__
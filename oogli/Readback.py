@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import ctypes
+
+from glfw import gl
+import numpy as np
+
+from .state import State
+
+
+class Readback(object):
+    '''Asynchronous framebuffer reads through a ring of pixel pack buffers
+
+    Each ``read`` starts copying the current framebuffer into the next
+    buffer of the ring and returns the frame read ``depth - 1`` calls ago
+    (None until the ring has filled), so the GPU never has to finish the
+    current frame before the CPU can continue.
+
+    The returned array is a view of the mapped buffer: it is valid until
+    the next ``read`` and costs no copy.  Pass ``out`` to keep a frame.
+
+    >>> readback = Readback(win.width, win.height, fmt=gl.BGRA)
+    >>> while win.open:
+    ...     program.draw(...)
+    ...     frame = readback.read()
+    ...     if frame is not None:
+    ...         video.write(frame)
+    ...     win.cycle()
+    '''
+    components = {
+        gl.RGBA: 4,
+        gl.BGRA: 4,
+        gl.RGB: 3,
+        gl.BGR: 3,
+    }
+
+    def __init__(self, width, height, depth=3, fmt=gl.RGBA):
+        assert fmt in self.components, 'Unsupported readback format: {}'.format(fmt)
+        assert depth >= 1, 'A readback ring needs at least one buffer'
+        self.width = width
+        self.height = height
+        self.fmt = fmt
+        self.shape = (height, width, self.components[fmt])
+        self.nbytes = int(np.prod(self.shape))
+        self.buffers = [gl.gen_buffers(1) for _ in range(depth)]
+        self.fences = [None] * depth
+        self.frame = 0
+        self.mapped = None
+        state = State.current()
+        for buffer_id in self.buffers:
+            state.bind_buffer(gl.PIXEL_PACK_BUFFER, buffer_id)
+            gl.buffer_data(gl.PIXEL_PACK_BUFFER, self.nbytes, None, gl.STREAM_READ)
+        state.bind_buffer(gl.PIXEL_PACK_BUFFER, 0)
+
+    @property
+    def depth(self):
+        return len(self.buffers)
+
+    def read(self, x=0, y=0, out=None):
+        '''Queues a read of the current frame and returns an older one'''
+        state = State.current()
+        self.unmap()
+        index = self.frame % self.depth
+        state.bind_buffer(gl.PIXEL_PACK_BUFFER, self.buffers[index])
+        # Rows of RGB pixels are not 4 byte aligned
+        gl.pixel_storei(gl.PACK_ALIGNMENT, 1 if self.shape[-1] == 3 else 4)
+        # An offset into the bound pack buffer rather than client memory
+        gl.read_pixels(x, y, self.width, self.height, self.fmt, gl.UNSIGNED_BYTE, ctypes.c_void_p(0))
+        self.fences[index] = gl.fence_sync(gl.SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.frame += 1
+        if self.frame < self.depth:
+            state.bind_buffer(gl.PIXEL_PACK_BUFFER, 0)
+            return None
+        pixels = self.map(self.frame % self.depth)
+        state.bind_buffer(gl.PIXEL_PACK_BUFFER, 0)
+        if out is not None:
+            np.copyto(out, pixels)
+            return out
+        return pixels
+
+    __call__ = read
+
+    def map(self, index):
+        '''Maps buffer ``index`` once its read has finished'''
+        fence = self.fences[index]
+        if fence is not None:
+            gl.client_wait_sync(fence, gl.SYNC_FLUSH_COMMANDS_BIT, gl.TIMEOUT_IGNORED)
+            gl.delete_sync(fence)
+            self.fences[index] = None
+        State.current().bind_buffer(gl.PIXEL_PACK_BUFFER, self.buffers[index])
+        address = gl.map_buffer_range(gl.PIXEL_PACK_BUFFER, 0, self.nbytes, gl.MAP_READ_BIT)
+        self.mapped = self.buffers[index]
+        memory = (ctypes.c_ubyte * self.nbytes).from_address(address)
+        return np.frombuffer(memory, dtype=np.uint8).reshape(self.shape)
+
+    def unmap(self):
+        '''Releases the view handed out by the previous read'''
+        if self.mapped is not None:
+            State.current().bind_buffer(gl.PIXEL_PACK_BUFFER, self.mapped)
+            gl.unmap_buffer(gl.PIXEL_PACK_BUFFER)
+            State.current().bind_buffer(gl.PIXEL_PACK_BUFFER, 0)
+            self.mapped = None
+
+    def delete(self):
+        '''Frees the buffers and any pending fences'''
+        self.unmap()
+        for fence in self.fences:
+            if fence is not None:
+                gl.delete_sync(fence)
+        for buffer_id in self.buffers:
+            gl.delete_buffers(1, [buffer_id])
+        self.fences = []
+        self.buffers = []
+
+    def __repr__(self):
+        cname = self.__class__.__name__
+        width, height, depth = self.width, self.height, self.depth
+        string = '<{cname} {width}x{height} depth={depth}>'.format(**locals())
+        return string
@@ -8,6 +8,9 @@ import threading
 import glfw
 import glfw.gl as gl
 
+from . import context
+from .state import State
+
 
 log = logging.getLogger('Window')
 
@@ -21,7 +24,7 @@ class Window(object):
     registry = {}
 
     def __enter__(self):
-        return self
+        return self.make_current()
 
     def __exit__(self, *args, **kwds):
         glfw.core.set_window_should_close(self.win, True)
@@ -29,7 +32,7 @@ class Window(object):
     def clear(self):
         '''Clears the window'''
         black_background_color = [0.0, 0.0, 0.0, 1.0]
-        gl.clear_color(*black_background_color)
+        self.state.clear_color(*black_background_color)
         gl.clear(gl.COLOR_BUFFER_BIT)
         if self.open:
             self.cycle()
@@ -59,9 +62,13 @@ class Window(object):
         return fb_height
 
     def __init__(self, title='GLFW Example', height=480, width=640, major=None, minor=None, visible=True, focus=True, background=None):
+        # Default to the version shaders have asked for since the last window
+        version = context.claim()
+        if major is None and minor is None and version:
+            major, minor = version
         # Determine available major/minor compatibility
-        #  This contains init and terminate logic for glfw, so it must be run first
-        major, minor = self.get_opengl_version(major, minor)
+        requested = (major, minor)
+        major, minor = self.get_opengl_version(*requested)
         self.title = title
 
         # Lock is for thread aware Windows and opening, closing and garbage
@@ -71,36 +78,29 @@ class Window(object):
         if not glfw.core.init():
             raise RuntimeError('Could not initialize glfw')
 
-        # Hinting must be run before window creation
-        glfw.core.window_hint(glfw.CONTEXT_VERSION_MAJOR, major)
-        glfw.core.window_hint(glfw.CONTEXT_VERSION_MINOR, minor)
-        glfw.core.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
-        glfw.core.window_hint(glfw.OPENGL_FORWARD_COMPAT, gl.TRUE)
-        glfw.core.window_hint(glfw.VISIBLE, visible)
-        glfw.core.window_hint(glfw.FOCUSED, focus)
-
-        # Unnecessary
-        glfw.core.window_hint(glfw.SAMPLES, 1)
-        glfw.core.window_hint(glfw.RED_BITS, 8)
-        glfw.core.window_hint(glfw.GREEN_BITS, 8)
-        glfw.core.window_hint(glfw.BLUE_BITS, 8)
-        glfw.core.window_hint(glfw.ALPHA_BITS, 8)
-        glfw.core.window_hint(glfw.DEPTH_BITS, 8)
-
         # Generate window
-        self.win = glfw.create_window(height=height, width=width, title=title)
+        win = self.create(title, width, height, major, minor, visible, focus)
+        if win is None:
+            # The version remembered on disk may no longer be supported
+            context.forget((major, minor))
+            major, minor = self.get_opengl_version(*requested)
+            win = self.create(title, width, height, major, minor, visible, focus)
+        if win is None:
+            raise RuntimeError('Could not create a window for OpenGL {}.{}'.format(major, minor))
+        self.win = win
         Window.registry[self.win] = self
 
         # Setup window callbacks: Must be run after creating an OpenGL window
         self.setup_callbacks()
 
         # Set context
-        glfw.core.make_context_current(self.win)
+        self.make_current()
+        context.remember((major, minor))
         self.init()
         if background is not None:
             bg = [0.0, 0.0, 0.0, 1.0]
             background = list(background) + bg[len(background):]
-            gl.clear_color(*background)
+            self.state.clear_color(*background)
 
     def __del__(self):
         '''Removes the glfw window'''
@@ -109,57 +109,53 @@ class Window(object):
             # Wait for loop to end
             self.lock.acquire()
             glfw.core.destroy_window(self.win)
+            State.release(self.win)
             self.lock.release()
 
-    def get_opengl_version(self, major=None, minor=None):
-        '''Contains logic to determine opengl version.
+    def make_current(self):
+        '''Makes this window's context (and its State) current
 
-        Only run this within initialization before running standard window code
+        Call this before drawing when switching between windows, so the
+        shadow State matches the context the calls go to.
         '''
-        # Determine available major/minor compatibility
-        #  This contains init and terminate logic for glfw, so it must be run first
-        ffi = glfw._ffi
-        opengl_version = (gl.get_integerv(gl.MAJOR_VERSION), gl.get_integerv(gl.MINOR_VERSION))
-        versions = [
-            (4, 5), (4, 4), (4, 3), (4, 2), (4, 1), (4, 0),
-            (3, 3), (3, 2), (3, 1), (3, 0),
-            (2, 1), (2, 0),
-            (1, 5), (1, 4), (1, 3), (1, 2), (1, 1), (1, 0),
-        ]
-        if major or minor:
-            if major:
-                versions = [(M, m) for M, m in versions if M >= major]
-            if minor:
-                versions = [(M, m) for M, m in versions if m >= minor]
-        farg = ffi.new('char []', bytes(''.encode('utf-8')))
-        title = farg
+        glfw.core.make_context_current(self.win)
+        self.state = State.activate(self.win)
+        return self
+
+    @staticmethod
+    def create(title, width, height, major, minor, visible, focus):
+        '''Creates a glfw window for an OpenGL major.minor context; None
+        if the driver refuses'''
+        # Hinting must be run before window creation
+        glfw.core.window_hint(glfw.CONTEXT_VERSION_MAJOR, major)
+        glfw.core.window_hint(glfw.CONTEXT_VERSION_MINOR, minor)
+        glfw.core.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+        glfw.core.window_hint(glfw.OPENGL_FORWARD_COMPAT, gl.TRUE)
+        glfw.core.window_hint(glfw.VISIBLE, visible)
+        glfw.core.window_hint(glfw.FOCUSED, focus)
+
+        # Unnecessary
+        glfw.core.window_hint(glfw.SAMPLES, 1)
+        glfw.core.window_hint(glfw.RED_BITS, 8)
+        glfw.core.window_hint(glfw.GREEN_BITS, 8)
+        glfw.core.window_hint(glfw.BLUE_BITS, 8)
+        glfw.core.window_hint(glfw.ALPHA_BITS, 8)
+        glfw.core.window_hint(glfw.DEPTH_BITS, 8)
+        return glfw.create_window(height=height, width=width, title=title)
+
+    def get_opengl_version(self, major=None, minor=None):
+        '''Highest available OpenGL version of at least major.minor
 
+        Probes are cached per process (and on disk when
+        ``context.cache_dir`` is set), so only the first window pays for
+        them.
+        '''
         if not glfw.core.init():
-            glfw.terminate()
             raise RuntimeError('Could not initialize GLFW')
-
-        for major, minor in versions:
-            try:
-                glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, major)
-                glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, minor)
-                glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
-                if major >= 3 and minor in [0, 1]:
-                    glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, gl.GL_TRUE)
-                glfw.window_hint(glfw.VISIBLE, False)
-                glfw.window_hint(glfw.FOCUSED, False)
-                window = glfw.core.create_window(1, 1, title, ffi.NULL, ffi.NULL)
-                if window != ffi.NULL:
-                    glfw.destroy_window(window)
-                    if opengl_version is None or opengl_version == (0, 0):
-                        opengl_version = (major, minor)
-            except Exception as e:
-                import traceback as tb
-                for line in tb.format_exc(e).split('\n'):
-                    log.error(line)
-
-        glfw.terminate()
-        if opengl_version is None or not opengl_version > (0, 0):
-            raise RuntimeError('Could not set opengl context to version: {}.{}'.format(major, minor))
+        minimum = (major or 0, minor or 0)
+        opengl_version = context.highest(minimum)
+        if opengl_version is None:
+            raise RuntimeError('Could not set opengl context to version: {}.{}'.format(*minimum))
         return opengl_version
 
     def init(self):
@@ -196,6 +192,7 @@ class Window(object):
     def loop(self):
         '''Simplified loop'''
         self.lock.acquire()
+        self.make_current()
         while self.open:
             self.render()
             self.handle_buffers_and_events()
@@ -207,8 +204,8 @@ class Window(object):
 
     def set_background(self, color):
         default_color = [0.0, 0.0, 0.0, 1.0]
-        color = color + default_color[len(color):]
-        gl.clear_color(color)
+        color = list(color) + default_color[len(color):]
+        self.state.clear_color(*color)
         gl.clear(gl.COLOR_BUFFER_BIT)
 
     def setup_callbacks(self):
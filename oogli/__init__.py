@@ -45,9 +45,20 @@ import glfw
 from glfw import gl
 import numpy as np
 
+from .Batch import Batch
+from . import context
+from .CommandList import CommandList
+from .Framebuffer import Framebuffer
+from .Mesh import Mesh
 from .Program import Program
+from .Readback import Readback
+from .render import render_many
 from .Window import Window
-from .textures import Texture
+from .context import Context
+from .state import State
+from .textures import Loader, Residency, Texture, TextureArray
+from .atlas import Atlas
+from .uniforms import UniformBlock
 
 ###############################################################################
 __title__ = 'oogli'
@@ -62,7 +73,7 @@ __shortdesc__ = 'Oogli is a beautiful object oriented graphics library interface
 
 ###############################################################################
 def create_program(v_shader, f_shader):
-    assert glfw.core.init() != 0
+    assert context.initialized()
     program = Program(v_shader, f_shader)
     program.build()
     return program
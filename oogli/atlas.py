@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from collections import namedtuple, OrderedDict
+import json
+import os
+
+from glfw import gl
+from PIL import Image
+import numpy as np
+
+from .textures import TextureArray, cached, decode, mipmaps
+
+# Placement of an image: layer (page) of the atlas, pixel rectangle and
+#  texture coordinates (u0, v0, u1, v1)
+Region = namedtuple('Region', ['page', 'x', 'y', 'width', 'height', 'uv'])
+
+
+class Skyline(object):
+    '''Bottom-left skyline packer for one page
+
+    The skyline is a list of [x, y, width] segments covering the page
+    width; each rectangle goes where its top edge ends up lowest.
+    '''
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.segments = [[0, 0, width]]
+
+    def fit(self, index, width, height):
+        '''Lowest y a rectangle starting at segment ``index`` can take'''
+        x = self.segments[index][0]
+        if x + width > self.width:
+            return None
+        y, remaining = 0, width
+        while remaining > 0:
+            if index == len(self.segments):
+                return None
+            segment_x, segment_y, segment_width = self.segments[index]
+            y = max(y, segment_y)
+            if y + height > self.height:
+                return None
+            remaining -= segment_width - (x - segment_x if segment_x < x else 0)
+            index += 1
+        return y
+
+    def insert(self, width, height):
+        '''Places a rectangle and returns its (x, y), or None if full'''
+        best = None
+        for index, (x, _, _) in enumerate(self.segments):
+            y = self.fit(index, width, height)
+            if y is not None and (best is None or (y + height, x) < (best[1] + height, best[0])):
+                best = (x, y, index)
+        if best is None:
+            return None
+        x, y, index = best
+        self.segments.insert(index, [x, y + height, width])
+        # Shrink or drop the segments now under the new one
+        index += 1
+        while index < len(self.segments):
+            segment = self.segments[index]
+            covered = x + width - segment[0]
+            if covered <= 0:
+                break
+            if covered < segment[2]:
+                segment[0] += covered
+                segment[2] -= covered
+                break
+            del self.segments[index]
+        # Merge neighbours of equal height
+        index = 0
+        while index + 1 < len(self.segments):
+            if self.segments[index][1] == self.segments[index + 1][1]:
+                self.segments[index][2] += self.segments.pop(index + 1)[2]
+            else:
+                index += 1
+        return x, y
+
+
+def rgba(pixels):
+    '''Expands (height, width, channels) uint8 pixels to RGBA'''
+    channels = pixels.shape[-1]
+    if channels == 4:
+        return pixels
+    alpha = pixels[..., 1:2] if channels == 2 else np.full(pixels.shape[:-1] + (1, ), 255, dtype=np.uint8)
+    colors = pixels[..., :1].repeat(3, axis=-1) if channels in (1, 2) else pixels
+    return np.concatenate([colors, alpha], axis=-1)
+
+
+class Atlas(TextureArray):
+    '''Many small images packed into the pages (layers) of one texture
+
+    Images are packed with a skyline packer into ``size`` x ``size`` RGBA
+    pages uploaded as a single GL_TEXTURE_2D_ARRAY, so drawing thousands
+    of icons needs one bind.  ``regions`` maps each image path to its
+    page and UV rectangle.
+
+    Passing ``layout`` keeps the packing in a JSON file; while the images
+    are unchanged it is reused without packing, and with
+    ``context.cache_dir`` set the composed pages are cached as well.
+
+    >>> icons = Atlas(glob.glob('icons/*.png'), layout='icons.json')
+    >>> page, x, y, width, height, (u0, v0, u1, v1) = icons.regions['icons/save.png']
+    >>> icons.bind(unit=0)
+    '''
+
+    def __init__(self, image_paths, size=1024, padding=1, layout=None, **kwds):
+        self.page_size = size
+        self.padding = padding
+        self.layout = layout
+        image_paths = list(image_paths)
+        self.regions = self.load(image_paths) if layout else None
+        if self.regions is None:
+            self.regions = self.pack(image_paths)
+            if layout:
+                self.save(layout)
+        self.pages = 1 + max(region.page for region in self.regions.values()) if self.regions else 0
+        TextureArray.__init__(self, image_paths, **kwds)
+
+    def stamp(self, image_paths):
+        '''What a saved layout must match to be reused'''
+        return {
+            'size': self.page_size,
+            'padding': self.padding,
+            'images': [[path, os.path.getmtime(path)] for path in image_paths],
+        }
+
+    def pack(self, image_paths):
+        '''Places every image, tallest first, opening pages as needed'''
+        shapes = {}
+        for path in image_paths:
+            # Only the header is read here
+            with Image.open(path) as image:
+                width, height = image.size
+            error_message = '{} ({}x{}) does not fit a {} pixel page'.format(path, width, height, self.page_size)
+            assert max(width, height) + 2 * self.padding <= self.page_size, error_message
+            shapes[path] = (width, height)
+        pages = []
+        placed = {}
+        for path in sorted(image_paths, key=lambda p: (-shapes[p][1], -shapes[p][0])):
+            width, height = shapes[path]
+            padded = (width + 2 * self.padding, height + 2 * self.padding)
+            for page, skyline in enumerate(pages):
+                position = skyline.insert(*padded)
+                if position is not None:
+                    break
+            else:
+                pages.append(Skyline(self.page_size, self.page_size))
+                page, position = len(pages) - 1, pages[-1].insert(*padded)
+            x, y = position[0] + self.padding, position[1] + self.padding
+            placed[path] = self.region(page, x, y, width, height)
+        return OrderedDict((path, placed[path]) for path in image_paths)
+
+    def region(self, page, x, y, width, height):
+        size = float(self.page_size)
+        uv = (x / size, y / size, (x + width) / size, (y + height) / size)
+        return Region(page, x, y, width, height, uv)
+
+    def load(self, image_paths):
+        '''Regions from the layout file, or None if it is stale or damaged'''
+        if not os.path.exists(self.layout):
+            return None
+        try:
+            with open(self.layout, 'r') as fd:
+                data = json.load(fd)
+            if data.get('stamp') != json.loads(json.dumps(self.stamp(image_paths))):
+                return None
+            return OrderedDict(
+                (path, self.region(*data['regions'][path]))
+                for path in image_paths
+            )
+        except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+            # Truncated or hand-edited files are repacked
+            return None
+
+    def save(self, layout):
+        '''Writes the packed layout as JSON'''
+        data = {
+            'stamp': self.stamp(list(self.regions)),
+            'regions': dict((path, list(region[:5])) for path, region in self.regions.items()),
+        }
+        with open(layout, 'w') as fd:
+            json.dump(data, fd, indent=2, sort_keys=True)
+
+    def compose(self):
+        '''Draws every image into its page
+
+        The padding around each image repeats its edge pixels, so
+        filtering and mip levels do not blend in a neighbour's.
+        '''
+        pages = np.zeros((self.pages, self.page_size, self.page_size, 4), dtype=np.uint8)
+        pad = self.padding
+        for path, region in self.regions.items():
+            pixels = np.pad(rgba(decode(path)), ((pad, pad), (pad, pad), (0, 0)), mode='edge')
+            top, left = region.y - pad, region.x - pad
+            pages[region.page, top:top + pixels.shape[0], left:left + pixels.shape[1]] = pixels
+        if self.mipmaps != 'cpu':
+            return [pages]
+        chains = [mipmaps(page) for page in pages]
+        return [np.stack(level) for level in zip(*chains)]
+
+    def decode(self):
+        '''Composed pages, from the decoded texture cache when possible'''
+        if self.layout is None:
+            return self.compose()
+        params = (gl.TEXTURE_2D_ARRAY, self.mipmaps == 'cpu', json.dumps(self.stamp(list(self.regions)), sort_keys=True))
+        return cached(self.layout, params, self.compose)
+
+    def __repr__(self):
+        cname = self.__class__.__name__
+        texture_id = self.texture
+        images, pages, size = len(self.regions), self.pages, self.page_size
+        string = '<{cname}:{texture_id} images={images} pages={pages} ({size}, {size})>'.format(**locals())
+        return string
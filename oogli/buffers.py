@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from collections import namedtuple, OrderedDict
+
+from glfw import gl
+import numpy as np
+try:
+    from numpy import byte_bounds
+except ImportError:  # numpy >= 2.0
+    from numpy.lib.array_utils import byte_bounds
+
+from .state import State
+
+
+def _shares_memory(view, owner):
+    '''True if view lies entirely within owner's memory'''
+    lo, hi = byte_bounds(np.asarray(view))
+    start, stop = byte_bounds(np.asarray(owner))
+    return start <= lo and hi <= stop
+
+
+def _advanced(key):
+    '''True if indexing with key copies rather than views (lists, masks)'''
+    keys = key if isinstance(key, tuple) else (key, )
+    return any(isinstance(k, (list, np.ndarray, bool, np.bool_)) for k in keys)
+
+
+class DirtyArray(np.ndarray):
+    '''Numpy array that remembers which bytes changed since its last upload
+
+    Views (fields, slices) share the bookkeeping of the array that owns the
+    memory, so ``data['vertices'][3] = (0, 1)`` only marks that row.
+
+    >>> data = np.zeros(8, dtype=[('vertices', 'f4', 2)]).view(DirtyArray)
+    >>> data.clean()
+    >>> data['vertices'][3] = (0.0, 1.0)
+    >>> data.dirty
+    (24, 32)
+    '''
+
+    def __array_finalize__(self, obj):
+        owner = getattr(obj, '_owner', None)
+        if owner is not None and not _shares_memory(self, owner):
+            # Copies and ufunc results start their own bookkeeping
+            owner = None
+        if owner is None:
+            # A brand new array or a view over a plain ndarray owns itself
+            #  and starts out entirely dirty.
+            owner = self
+            self._dirty = None if self.nbytes == 0 else (0, self.nbytes)
+            self._uploaded = None
+        self._owner = owner
+
+    @property
+    def dirty(self):
+        '''Byte range (start, stop) of the owner that needs uploading'''
+        return self._owner._dirty
+
+    def clean(self):
+        '''Marks all of the data as uploaded'''
+        self._owner._dirty = None
+
+    def touch(self, key=None):
+        '''Marks ``self[key]`` (or all of self) as modified'''
+        if isinstance(key, (int, np.integer)) and self.ndim:
+            # Integer indexing returns scalars; track the row instead
+            key = slice(key, key + 1 or None)
+        elif _advanced(key):
+            # The indexed elements are a copy; mark all of self instead
+            key = None
+        view = self if key is None else np.ndarray.__getitem__(self, key)
+        if not isinstance(view, np.ndarray):
+            view = self
+        owner = self._owner
+        start, stop = byte_bounds(np.asarray(owner))
+        lo, hi = byte_bounds(np.asarray(view))
+        lo, hi = lo - start, hi - start
+        if owner._dirty is not None:
+            lo, hi = min(lo, owner._dirty[0]), max(hi, owner._dirty[1])
+        owner._dirty = (lo, hi)
+
+    def __setitem__(self, key, val):
+        np.ndarray.__setitem__(self, key, val)
+        self.touch(key)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwds):
+        inputs = [np.asarray(i) if isinstance(i, DirtyArray) else i for i in inputs]
+        outputs = kwds.get('out', ())
+        if outputs:
+            kwds['out'] = tuple(np.asarray(o) if isinstance(o, DirtyArray) else o for o in outputs)
+        result = getattr(ufunc, method)(*inputs, **kwds)
+        for out in outputs:
+            if isinstance(out, DirtyArray):
+                out.touch()
+        return result
+
+
+class Buffer(namedtuple('Buffer', ['id', 'data'])):
+    '''An OpenGL buffer object and the numpy data mirrored into it'''
+
+    __slots__ = ()
+
+    def upload(self, target=gl.ARRAY_BUFFER, usage=gl.STATIC_DRAW):
+        '''Binds the buffer and sends only what changed since last upload
+
+        The first upload (or any upload after a resize) allocates storage
+        with ``buffer_data``; after that only the dirty byte range is
+        re-sent with ``buffer_sub_data``.  Clean buffers are not even bound.
+        '''
+        data = self.data
+        state = State.current()
+        if not isinstance(data, DirtyArray):
+            state.bind_buffer(target, self.id)
+            gl.buffer_data(target, data.nbytes, data, usage)
+            return
+        owner = data._owner
+        if owner._uploaded == owner.nbytes and owner._dirty is None:
+            return
+        state.bind_buffer(target, self.id)
+        if owner._uploaded != owner.nbytes:
+            gl.buffer_data(target, owner.nbytes, np.asarray(owner), usage)
+            owner._uploaded = owner.nbytes
+        elif owner._dirty is not None:
+            start, stop = owner._dirty
+            raw = np.asarray(owner).reshape(-1).view(np.uint8)
+            gl.buffer_sub_data(target, start, stop - start, raw[start:stop])
+        owner.clean()
+
+
+# How one vertex attribute is read: numpy type and count of its
+#  components, byte stride between vertices, byte offset of the first and
+#  whether integers map to [0, 1] ([-1, 1] if signed) for float inputs
+Pointer = namedtuple('Pointer', ['dtype', 'components', 'stride', 'offset', 'normalized'])
+
+
+def pointers(layout, count=None, normalized=None):
+    '''Attribute pointers for vertex data described by ``layout``
+
+    ``layout`` is anything numpy accepts as a dtype for one vertex.  Its
+    fields are interleaved unless ``count`` is given, in which case each
+    field is a block of ``count`` values following the previous field.
+
+    ``normalized`` maps field names to whether their integers are
+    normalized when read by float inputs.  By default 8 and 16 bit
+    integers (colours, packed normals) are and wider ones are not.
+    '''
+    layout = np.dtype(layout)
+    normalized = normalized or {}
+    result = OrderedDict()
+    offset = 0
+    for name in layout.names or ():
+        field_type, field_offset = layout.fields[name][:2]
+        base = field_type.base
+        components = field_type.shape[-1] if field_type.shape else 1
+        normalize = normalized.get(name, base.kind in 'iu' and base.itemsize <= 2)
+        if count is None:
+            result[name] = Pointer(base, components, layout.itemsize, field_offset, normalize)
+        else:
+            result[name] = Pointer(base, components, field_type.itemsize, offset, normalize)
+            offset += count * field_type.itemsize
+    return result
+
+
+def vertex_view(data, layout, planar=False, normalized=None):
+    '''Views vertex data held by any buffer without copying it
+
+    ``data`` can be anything exposing the buffer protocol: an ndarray or
+    np.memmap, bytes, bytearray, memoryview, array.array or mmap.
+    Interleaved data becomes a structured array of ``layout`` records;
+    planar data (every vertex's first field, then every vertex's second
+    field...) stays a flat array of bytes.
+
+    Returns the array, its attribute pointers (see ``pointers`` for
+    ``normalized``) and the vertex count.
+
+    >>> mapped = np.memmap('terrain.bin', mode='r')
+    >>> view, attributes, count = vertex_view(mapped, [('vertices', 'f4', 3), ('normals', 'f4', 3)], planar=True)
+    '''
+    layout = np.dtype(layout)
+    if not planar:
+        view = np.frombuffer(data, dtype=layout)
+        return view, pointers(layout, normalized=normalized), len(view)
+    view = np.frombuffer(data, dtype=np.uint8)
+    vertex_size = sum(layout.fields[name][0].itemsize for name in layout.names)
+    count, remainder = divmod(view.nbytes, vertex_size)
+    assert not remainder, 'Planar data of {} bytes does not hold whole {} byte vertices'.format(view.nbytes, vertex_size)
+    return view, pointers(layout, count, normalized), count
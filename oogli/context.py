@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Process-wide registry of OpenGL context versions
+
+Shaders record the version they need here instead of creating a window,
+windows pick it up as their default, and probing whether a version can be
+created happens at most once per (major, minor, profile).
+
+Set ``cache_dir`` (or the ``OOGLI_CACHE_DIR`` environment variable) to
+also keep the highest available version on disk, so later processes
+create their first window without probing.
+
+``Context`` provides a headless context (EGL or OSMesa) for machines
+without a display server.
+'''
+import ctypes
+import json
+import os
+import platform
+import threading
+
+import glfw
+from glfw import gl
+import numpy as np
+
+from .Framebuffer import Framebuffer
+from .state import State
+
+# Opt-in directory for on-disk caches
+cache_dir = os.environ.get('OOGLI_CACHE_DIR')
+# Candidate versions, highest first
+versions = [
+    (4, 6), (4, 5), (4, 4), (4, 3), (4, 2), (4, 1), (4, 0),
+    (3, 3), (3, 2), (3, 1), (3, 0),
+    (2, 1), (2, 0),
+    (1, 5), (1, 4), (1, 3), (1, 2), (1, 1), (1, 0),
+]
+# Versions requested by shaders parsed since the last context was created
+requested = set()
+# (major, minor, profile) -> whether a context could be created
+probes = {}
+_lock = threading.Lock()
+
+
+def profile(version):
+    '''OpenGL profile used for a (major, minor) version'''
+    return glfw.OPENGL_ANY_PROFILE if tuple(version) < (3, 2) else glfw.OPENGL_CORE_PROFILE
+
+
+def hint(major, minor, profile_type=None, visible=False, focused=False):
+    '''Sets the window hints for a context of the given version'''
+    version = (major, minor)
+    profile_type = profile(version) if profile_type is None else profile_type
+    glfw.core.window_hint(glfw.CONTEXT_VERSION_MAJOR, major)
+    glfw.core.window_hint(glfw.CONTEXT_VERSION_MINOR, minor)
+    glfw.core.window_hint(glfw.OPENGL_PROFILE, profile_type)
+    # Setup forward compatibility if able
+    forward_compat = gl.FALSE if version < (3, 0) else gl.TRUE
+    glfw.core.window_hint(glfw.OPENGL_FORWARD_COMPAT, forward_compat)
+    glfw.core.window_hint(glfw.VISIBLE, visible)
+    glfw.core.window_hint(glfw.FOCUSED, focused)
+
+
+def require(version):
+    '''Records that a context of at least ``version`` is needed'''
+    version = tuple(version)
+    requested.add(version)
+    return version
+
+
+def required():
+    '''Highest version requested since the last context was created, or
+    None'''
+    return max(requested) if requested else None
+
+
+def claim():
+    '''Returns ``required()`` and starts over for the next context
+
+    Requests only carry over to the next Window or Context, so shaders
+    parsed for one context do not raise the version of later ones.
+    '''
+    version = required()
+    requested.clear()
+    return version
+
+
+def supported(major, minor, profile_type=None):
+    '''Determines if a context of the given version can be created
+
+    The first call per (major, minor, profile) creates and destroys a
+    hidden 1x1 window; later calls are answered from ``probes``.
+    '''
+    profile_type = profile((major, minor)) if profile_type is None else profile_type
+    key = (major, minor, profile_type)
+    if key not in probes:
+        with _lock:
+            if key not in probes:
+                assert glfw.core.init() != 0
+                hint(major, minor, profile_type)
+                win = glfw.create_window(title='probe', width=1, height=1)
+                probes[key] = win is not None
+                if win is not None:
+                    glfw.core.destroy_window(win)
+    return probes[key]
+
+
+def driver():
+    '''Vendor, renderer and version strings of the current context'''
+    strings = []
+    for name in (gl.GL_VENDOR, gl.GL_RENDERER, gl.GL_VERSION):
+        value = gl.get_string(name) or b''
+        strings.append(value.decode('utf-8') if isinstance(value, bytes) else value)
+    return ' | '.join(strings)
+
+
+def _cache_file():
+    if cache_dir:
+        return os.path.join(cache_dir, 'context.json')
+
+
+def _host():
+    return '{} {}'.format(platform.node(), platform.platform())
+
+
+def load():
+    '''Returns the persisted {'driver': ..., 'version': ...} for this host'''
+    path = _cache_file()
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'r') as fd:
+                return json.load(fd).get(_host())
+        except (IOError, OSError, ValueError):
+            return None
+
+
+def save(record):
+    '''Persists (or with None, forgets) the record for this host'''
+    path = _cache_file()
+    if not path:
+        return
+    data = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as fd:
+                data = json.load(fd)
+        except (IOError, OSError, ValueError):
+            data = {}
+    if record is None:
+        data.pop(_host(), None)
+    else:
+        data[_host()] = record
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    with open(path, 'w') as fd:
+        json.dump(data, fd, indent=2, sort_keys=True)
+
+
+def highest(minimum=None):
+    '''Highest available version of at least ``minimum``
+
+    Answers from the on-disk record when there is one, otherwise probes
+    candidate versions from the top down and stops at the first success.
+    '''
+    minimum = tuple(minimum or (0, 0))
+    record = load()
+    if record is not None and tuple(record['version']) >= minimum:
+        version = tuple(record['version'])
+        probes[version + (profile(version), )] = True
+        return version
+    for version in versions:
+        if version < minimum:
+            break
+        if supported(*version):
+            return version
+
+
+def remember(version):
+    '''Records the highest version along with the current context's driver
+
+    Call with a context current.  A record made for a different driver is
+    dropped so the next process probes again.
+    '''
+    if not _cache_file():
+        return
+    current = driver()
+    record = load()
+    if record is not None and record['driver'] != current:
+        save(None)
+    elif record is None:
+        save({'driver': current, 'version': list(version)})
+
+
+def forget(version):
+    '''Drops the record and probe of a version that failed to create a
+    context, so the next ``highest`` probes again'''
+    version = tuple(version)
+    save(None)
+    probes.pop(version + (profile(version), ), None)
+
+
+def initialized():
+    '''True if a headless Context exists or GLFW could be initialized'''
+    return Context.active is not None or bool(glfw.core.init())
+
+
+class Context(object):
+    '''Headless OpenGL context rendering into an offscreen Framebuffer
+
+    Uses surfaceless EGL (e.g. Mesa llvmpipe or a GPU without a display)
+    or OSMesa, so no window or display server is needed.  PyOpenGL picks
+    its platform when first imported, so ``PYOPENGL_PLATFORM`` must be set
+    to ``egl`` or ``osmesa`` before importing oogli.
+
+    Programs, Textures and ``screenshot`` work as they do with a Window.
+
+    >>> # PYOPENGL_PLATFORM=egl python render.py
+    >>> ctx = Context(width=256, height=256)
+    >>> program.draw(vertices=triangle)
+    >>> pixels = oogli.screenshot(ctx)
+    '''
+    active = None
+
+    def __init__(self, width=640, height=480, major=None, minor=None, backend=None):
+        self.backend = backend or os.environ.get('PYOPENGL_PLATFORM', 'egl')
+        assert self.backend in ('egl', 'osmesa'), 'Unknown headless backend: {}'.format(self.backend)
+        from OpenGL import platform as gl_platform
+        loaded = type(gl_platform.PLATFORM).__name__.lower()
+        error_message = 'Set PYOPENGL_PLATFORM={} before importing oogli (PyOpenGL uses {})'.format(self.backend, loaded)
+        assert loaded.startswith(self.backend), error_message
+        version = claim()
+        if major is None and minor is None and version:
+            major, minor = version
+        minimum = (major or 0, minor or 0)
+        self.handle = None
+        for version in versions:
+            if version < minimum or version < (3, 2):
+                break
+            self.handle = getattr(self, 'create_{}'.format(self.backend))(*version)
+            if self.handle is not None:
+                self.version = version
+                break
+        if self.handle is None:
+            raise RuntimeError('Could not create a headless context of version: {}.{}'.format(*minimum))
+        self.make_current()
+        probes[self.version + (profile(self.version), )] = True
+        self.framebuffer = Framebuffer(width, height)
+        self.framebuffer.bind()
+
+    def create_egl(self, major, minor):
+        '''Surfaceless EGL context, or None'''
+        from OpenGL import EGL
+        if not hasattr(self, 'display'):
+            # EGL_PLATFORM_SURFACELESS_MESA needs no display server at all
+            self.display = EGL.eglGetPlatformDisplayEXT(0x31DD, EGL.EGL_DEFAULT_DISPLAY, None)
+            if not self.display:
+                self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+            major_version, minor_version = EGL.EGLint(), EGL.EGLint()
+            EGL.eglInitialize(self.display, ctypes.pointer(major_version), ctypes.pointer(minor_version))
+            EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+            attributes = (EGL.EGLint * 3)(EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE)
+            configs = (EGL.EGLConfig * 1)()
+            count = EGL.EGLint()
+            EGL.eglChooseConfig(self.display, attributes, configs, 1, ctypes.pointer(count))
+            # Without surfaces no config is needed (EGL_KHR_no_config_context)
+            self.config = configs[0] if count.value else None
+        attributes = (EGL.EGLint * 7)(
+            EGL.EGL_CONTEXT_MAJOR_VERSION, major,
+            EGL.EGL_CONTEXT_MINOR_VERSION, minor,
+            EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+            EGL.EGL_NONE,
+        )
+        try:
+            handle = EGL.eglCreateContext(self.display, self.config, EGL.EGL_NO_CONTEXT, attributes)
+        except EGL.EGLError:
+            return None
+        return handle or None
+
+    def create_osmesa(self, major, minor):
+        '''OSMesa context, or None'''
+        from OpenGL import osmesa
+        attributes = np.array([
+            osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+            osmesa.OSMESA_DEPTH_BITS, 24,
+            osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+            osmesa.OSMESA_CONTEXT_MAJOR_VERSION, major,
+            osmesa.OSMESA_CONTEXT_MINOR_VERSION, minor,
+            0,
+        ], dtype=np.int32)
+        handle = osmesa.OSMesaCreateContextAttribs(attributes, None)
+        # OSMesa needs a buffer to be current; rendering goes to the
+        #  Framebuffer so a single pixel is enough
+        self.buffer = np.zeros((1, 1, 4), dtype=np.uint8)
+        return handle or None
+
+    def make_current(self):
+        '''Makes this context (and its State) current'''
+        if self.backend == 'egl':
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.handle)
+        else:
+            from OpenGL import osmesa
+            osmesa.OSMesaMakeCurrent(self.handle, self.buffer, gl.UNSIGNED_BYTE, 1, 1)
+        Context.active = self
+        self.state = State.activate(self)
+        return self
+
+    @property
+    def width(self):
+        return self.framebuffer.width
+
+    @property
+    def height(self):
+        return self.framebuffer.height
+
+    fb_width = width
+    fb_height = height
+
+    def read(self, pixels=None):
+        '''Reads back the rendered pixels'''
+        return self.framebuffer.read(pixels)
+
+    def resize(self, width, height):
+        self.framebuffer.resize(width, height)
+        self.framebuffer.bind()
+
+    def delete(self):
+        '''Destroys the context'''
+        if self.handle is None:
+            return
+        if self.backend == 'egl':
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroyContext(self.display, self.handle)
+        else:
+            from OpenGL import osmesa
+            osmesa.OSMesaDestroyContext(self.handle)
+        self.handle = None
+        State.release(self)
+        if Context.active is self:
+            Context.active = None
+
+    def __enter__(self):
+        return self.make_current()
+
+    def __exit__(self, *args, **kwds):
+        self.delete()
+
+    def __repr__(self):
+        cname = self.__class__.__name__
+        backend = self.backend
+        major, minor = self.version
+        width, height = self.width, self.height
+        string = '<{cname} {backend} {major}.{minor} {width}x{height}>'.format(**locals())
+        return string
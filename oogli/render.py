@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''Renders batches of independent frames in parallel
+
+Each worker process owns a headless Context and a built Program, so
+software rendering uses every core.  Frames are written straight into
+shared memory allocated by the parent instead of being pickled back.
+
+    >>> # PYOPENGL_PLATFORM=egl python thumbnails.py
+    >>> jobs = [dict(color=(0.0, g, 0.0, 1.0)) for g in np.linspace(0, 1, 100)]
+    >>> frames = render_many((vshader, fshader), jobs, workers=8, vertices=triangle)
+    >>> frames.shape
+    (100, 256, 256, 3)
+'''
+import multiprocessing
+import traceback
+
+from glfw import gl
+import numpy as np
+
+from .context import Context
+from .Program import Program
+
+# Per process state of a worker
+_worker = {}
+
+
+def _initialize(program_spec, width, height, background, defaults, frames, count):
+    '''Creates the worker's context and program
+
+    Errors are kept for ``_render`` to raise: an initializer that raises
+    makes the pool respawn the worker forever instead of failing.
+    '''
+    try:
+        context = Context(width=width, height=height)
+        if isinstance(program_spec, dict):
+            program = Program(**program_spec)
+        else:
+            program = Program(*program_spec)
+        program.build()
+        # Vertex data shared by every job is uploaded once
+        shared = dict(
+            (key, defaults.pop(key))
+            for key in list(defaults)
+            if key in program.inputs or key in ('data', 'indices')
+        )
+        _worker.update(
+            context=context,
+            program=program,
+            mesh=program.setup(**shared) if shared else None,
+            background=background,
+            defaults=defaults,
+            frames=np.frombuffer(frames, dtype=np.uint8).reshape(count, height, width, 3),
+        )
+    except Exception:
+        _worker['error'] = RuntimeError('Worker setup failed:\n' + traceback.format_exc())
+
+
+def _render(task):
+    '''Renders one job into its slot of the shared frames'''
+    index, job = task
+    if 'error' in _worker:
+        raise _worker['error']
+    context, program = _worker['context'], _worker['program']
+    kwds = dict(_worker['defaults'])
+    kwds.update(job)
+    if not any(key in program.inputs or key in ('data', 'indices', 'mesh') for key in job):
+        kwds['mesh'] = _worker['mesh']
+    context.framebuffer.clear(_worker['background'])
+    program.draw(**kwds)
+    context.read(_worker['frames'][index])
+    return index
+
+
+def render_many(program_spec, jobs, workers=None, width=256, height=256, background=(0.0, 0.0, 0.0, 1.0), **defaults):
+    '''Renders one frame per job using a pool of worker processes
+
+    ``program_spec`` holds the shader sources given to Program, either as
+    a (vert, frag, ...) tuple or a dict of keywords.  Each job is a dict
+    of ``Program.draw`` keywords (inputs, uniforms, mode, fill) combined
+    with ``defaults``.
+
+    Returns a (len(jobs), height, width, 3) uint8 array in shared memory.
+    Workers need ``PYOPENGL_PLATFORM`` set to ``egl`` or ``osmesa``.
+    '''
+    jobs = list(jobs)
+    workers = workers or multiprocessing.cpu_count()
+    defaults.setdefault('fill', gl.FILL)
+    # Contexts must not be inherited by forking a process that owns one
+    get_context = getattr(multiprocessing, 'get_context', None)
+    processes = get_context('spawn') if get_context else multiprocessing
+    frames = processes.RawArray('B', max(len(jobs), 1) * height * width * 3)
+    initargs = (program_spec, width, height, background, defaults, frames, max(len(jobs), 1))
+    pool = processes.Pool(min(workers, max(len(jobs), 1)), initializer=_initialize, initargs=initargs)
+    try:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        for _ in pool.imap_unordered(_render, enumerate(jobs), chunksize):
+            pass
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return np.frombuffer(frames, dtype=np.uint8).reshape(-1, height, width, 3)[:len(jobs)]
@@ -4,28 +4,70 @@ from collections import OrderedDict
 import re
 from textwrap import dedent as dd
 
-import glfw
 from glfw import gl
 
+from . import context
+from .state import State
+
+
+def normalize(source):
+    '''Source with blank lines and common indentation removed'''
+    return dd('\n'.join([l for l in source.split('\n') if l.strip()]))
+
 
 class Shader(object):
 
     '''Wrapper for opengl boilerplate code'''
 
+    # (shader class, normalized source) -> shared Shader
+    registry = {}
+
     def __init__(self, source):
-        assert glfw.core.init(), 'Error: GLFW could not be initialized'
+        assert context.initialized(), 'Error: GLFW could not be initialized'
         self.inputs = OrderedDict()
         self.outputs = OrderedDict()
         self.uniforms = OrderedDict()
-        self.source = dd('\n'.join([l for l in source.split('\n') if l.strip()]))
+        self.blocks = OrderedDict()
+        self.source = normalize(source)
         self.parse(source)
-        self.compiled = False
+        # State -> GL shader id; shader objects belong to one context
+        self.ids = {}
+        # States of the contexts the shader has been compiled in
+        self.compiled_in = set()
+        self.references = 0
+
+    @classmethod
+    def acquire(cls, source):
+        '''Shared shader for source, parsed and compiled at most once
+
+        Every ``acquire`` must be paired with a ``release``; the GL shader
+        is deleted when the last user releases it.
+        '''
+        key = (cls, normalize(source))
+        shader = Shader.registry.get(key)
+        if shader is None:
+            shader = Shader.registry[key] = cls(source)
+        shader.references += 1
+        return shader
+
+    def release(self):
+        '''Drops one reference taken by ``acquire``'''
+        self.references -= 1
+        if self.references <= 0:
+            Shader.registry.pop((self.__class__, self.source), None)
+            self.delete()
 
     @property
     def shader(self):
-        if not hasattr(self, '_id'):
-            self._id = gl.create_shader(self.opengl_type)
-        return self._id
+        state = State.current()
+        if state not in self.ids:
+            self.ids[state] = gl.create_shader(self.opengl_type)
+        return self.ids[state]
+
+    @property
+    def compiled(self):
+        '''True once compiled in the current context'''
+        return State.current() in self.compiled_in
 
     def compile(self):
         '''Compiles and checks output'''
@@ -40,7 +82,7 @@ class Shader(object):
                 log = gl.get_shader_info_log(shader_id)
             if log.strip():
                 assert result == gl.TRUE and log_length == 0, log
-            self.compiled = True
+            self.compiled_in.add(State.current())
             return shader_id
 
     def attach(self, program):
@@ -49,16 +91,26 @@ class Shader(object):
         gl.attach_shader(program.program, self.shader)
 
     def detach(self, program):
-        if self.shader is not None:
+        if State.current() in self.ids:
             gl.detach_shader(program.program, self.shader)
 
     def delete(self):
-        if self.shader is not None:
-            gl.delete_shader(self.shader)
+        '''Deletes the GL shader in every context it was created in'''
+        # Shaders skipped by a cached program binary were never created,
+        #  and __init__ may have failed before there were any ids
+        ids = getattr(self, 'ids', None)
+        if not ids:
+            return
+        for state, shader_id in ids.items():
+            state.discard(gl.delete_shader, shader_id)
+        ids.clear()
+        self.compiled_in.clear()
 
     def cleanup(self, program):
         self.detach(program)
-        self.delete()
+        # Shared shaders stay compiled for the next program using them
+        if not self.references:
+            self.delete()
 
     def __del__(self):
         self.delete()
@@ -88,20 +140,8 @@ class Shader(object):
             yield key
 
     def set_context(self, version):
-        major, minor = version
-        glfw.core.window_hint(glfw.FOCUSED, False)
-        glfw.core.window_hint(glfw.CONTEXT_VERSION_MAJOR, major)
-        glfw.core.window_hint(glfw.CONTEXT_VERSION_MINOR, minor)
-        profile = glfw.OPENGL_ANY_PROFILE if version < (3, 2) else glfw.OPENGL_CORE_PROFILE
-        glfw.core.window_hint(glfw.OPENGL_PROFILE, profile)
-        # Setup forward compatibility if able
-        forward_compat = False if version < (3, 0) else True
-        glfw.core.window_hint(glfw.OPENGL_FORWARD_COMPAT, forward_compat)
-        #  Keep the window invisible
-        glfw.core.window_hint(glfw.VISIBLE, False)
-        win = glfw.create_window(title='test', width=1, height=1)
-        if win is not None:
-            glfw.core.destroy_window(win)
+        '''Records the context version this shader needs'''
+        major, minor = context.require(version)
         return major, minor
 
     def parse(self, source):
@@ -128,15 +168,23 @@ class Shader(object):
             r'((highp|mediump|lowp)\s+)?'
             r'(?P<vartype>\w+)\s+'
             r'(?P<varname>\w+)\s*'
+            r'(\[(?P<varsize>\d+)\])?'
             r'(\s*\=\s*(?P=vartype)?(?P<vardefault>(.+)))?'
             r'\;'
         )
+        blocks_pattern = (
+            r'^(layout\s*\((?P<layout>[^)]*)\)\s*)?'
+            r'uniform\s+'
+            r'(?P<blockname>\w+)\s*'
+            r'(\{|$)'
+        )
         version_eng = re.compile(version_pattern)
+        blocks_eng = re.compile(blocks_pattern)
         self.version = major, minor = (3, 2)
         engines = (
             [re.compile(inputs_pattern)] +
             [
-                re.compile(inputs2_pattern.replace('GLSL_TYPE', kind), flags=re.MULTILINE)
+                re.compile(inputs2_pattern.replace('GLSL_TYPE', '(?P<direction>{})'.format(kind)), flags=re.MULTILINE)
                 for kind in ('uniform', 'attribute', 'varying', 'const')
             ]
         )
@@ -146,6 +194,10 @@ class Shader(object):
                 data = [m.groupdict() for m in version_eng.finditer(line)][0]
                 version = tuple([int(c) for c in data['version']][:2])
                 self.version = opengl_mapping.get(version, version)
+            if blocks_eng.search(line):
+                data = [m.groupdict() for m in blocks_eng.finditer(line)][0]
+                self.blocks[data['blockname']] = data['layout'] or 'shared'
+                continue
             for eng in engines:
                 if eng.search(line):
                     data = [m.groupdict() for m in eng.finditer(line)][0]
@@ -153,6 +205,9 @@ class Shader(object):
                     vartype = data['vartype']
                     direction = data['direction']
                     default = data['vardefault']
+                    size = int(data['varsize'] or 1)
+                    if direction == 'attribute':
+                        direction = 'in'
                     if direction == 'in':
                         setattr(self, varname, vartype)
                         self.inputs[varname] = vartype
@@ -161,10 +216,7 @@ class Shader(object):
                         self.outputs[varname] = vartype
                     elif direction == 'uniform':
                         setattr(self, varname, vartype)
-                        if default:
-                            self.uniforms[varname] = ('uniform', vartype, default)
-                        else:
-                            self.uniforms[varname] = ('uniform', vartype, )
+                        self.uniforms[varname] = ('uniform', vartype, default, size)
                     break
         self.set_context(self.version)
 
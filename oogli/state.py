@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from glfw import gl
+
+
+def _toggle(capability, enabled):
+    '''Enables or disables a capability'''
+    if enabled:
+        gl.enable(capability)
+    else:
+        gl.disable(capability)
+
+
+class State(object):
+    '''Shadow copy of the OpenGL state of one context
+
+    Program, Mesh, Texture and Window route state changes through the
+    current context's State, which skips calls that would not change
+    anything.  ``issued`` and ``skipped`` count both outcomes.
+
+    Call ``reset`` after changing state with raw ``gl`` calls so the
+    shadow copy does not go stale.
+
+    >>> state = State.current()
+    >>> state.use_program(program.program)
+    True
+    >>> state.use_program(program.program)
+    False
+    '''
+    contexts = {}
+    active = None
+
+    @classmethod
+    def activate(cls, context=None):
+        '''Makes the State for ``context`` the current one
+
+        Call with ``context`` current; objects it was asked to free while
+        another context was current are freed now.
+        '''
+        if context not in cls.contexts:
+            cls.contexts[context] = cls()
+        cls.active = cls.contexts[context]
+        garbage, cls.active.garbage = cls.active.garbage, []
+        for func, args in garbage:
+            func(*args)
+        return cls.active
+
+    @classmethod
+    def current(cls):
+        '''State of the current context'''
+        return cls.active or cls.activate()
+
+    @classmethod
+    def release(cls, context=None):
+        '''Forgets the State of a destroyed context'''
+        state = cls.contexts.pop(context, None)
+        if state is not None and state is cls.active:
+            cls.active = None
+
+    def __init__(self):
+        self.values = {}
+        self.issued = 0
+        self.skipped = 0
+        # (func, args) freeing objects of this context once it is current
+        self.garbage = []
+
+    def reset(self):
+        '''Forgets all shadowed state; the next call of each kind is issued'''
+        self.values.clear()
+
+    def discard(self, func, *args):
+        '''Frees a GL object of this context with ``func(*args)``
+
+        GL names only mean something in the context that made them, so
+        the call waits until this context is current again.
+        '''
+        if State.active is self:
+            func(*args)
+        else:
+            self.garbage.append((func, args))
+
+    def set(self, key, func, *args):
+        '''Calls ``func(*args)`` unless ``key`` already holds ``args``'''
+        if self.values.get(key) == args:
+            self.skipped += 1
+            return False
+        func(*args)
+        self.values[key] = args
+        self.issued += 1
+        return True
+
+    def use_program(self, program_id):
+        return self.set('program', gl.use_program, program_id)
+
+    def bind_vertex_array(self, vao):
+        changed = self.set('vertex_array', gl.bind_vertex_array, vao)
+        if changed:
+            # The element array binding belongs to the vertex array
+            self.values.pop(('buffer', gl.ELEMENT_ARRAY_BUFFER), None)
+        return changed
+
+    def bind_buffer(self, target, buffer_id):
+        return self.set(('buffer', target), gl.bind_buffer, target, buffer_id)
+
+    def bind_buffer_base(self, target, index, buffer_id):
+        # Indexed binding also changes the generic binding point
+        self.values[('buffer', target)] = (target, buffer_id)
+        return self.set(('buffer_base', target, index), gl.bind_buffer_base, target, index, buffer_id)
+
+    def bind_framebuffer(self, target, framebuffer_id):
+        changed = self.set(('framebuffer', target), gl.bind_framebuffer, target, framebuffer_id)
+        if target == gl.FRAMEBUFFER:
+            # Binding both targets at once
+            for sub_target in (gl.DRAW_FRAMEBUFFER, gl.READ_FRAMEBUFFER):
+                self.values[('framebuffer', sub_target)] = (sub_target, framebuffer_id)
+        else:
+            self.values.pop(('framebuffer', gl.FRAMEBUFFER), None)
+        return changed
+
+    def viewport(self, x, y, width, height):
+        return self.set('viewport', gl.viewport, x, y, width, height)
+
+    def active_texture(self, unit):
+        return self.set('active_texture', gl.active_texture, unit)
+
+    def bind_texture(self, target, texture_id):
+        unit = self.values.get('active_texture', (gl.TEXTURE0, ))[0]
+        return self.set(('texture', unit, target), gl.bind_texture, target, texture_id)
+
+    def unbind_texture(self, texture_id):
+        '''Forgets the bindings of a texture that is being deleted'''
+        for key, args in list(self.values.items()):
+            if isinstance(key, tuple) and key[0] == 'texture' and args[-1] == texture_id:
+                del self.values[key]
+
+    def polygon_mode(self, face, mode):
+        return self.set(('polygon_mode', face), gl.polygon_mode, face, mode)
+
+    def enable(self, capability):
+        return self.set(('capability', capability), _toggle, capability, True)
+
+    def disable(self, capability):
+        return self.set(('capability', capability), _toggle, capability, False)
+
+    def clear_color(self, red, green, blue, alpha=1.0):
+        return self.set('clear_color', gl.clear_color, red, green, blue, alpha)
+
+    def __repr__(self):
+        cname = self.__class__.__name__
+        issued = self.issued
+        skipped = self.skipped
+        string = '<{cname} issued={issued} skipped={skipped}>'.format(**locals())
+        return string
@@ -1,42 +1,355 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import glfw
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import ctypes
+import hashlib
+import os
+
 from glfw import gl
 from PIL import Image
 import numpy as np
 
+from . import context
+from .state import State
+
+
+# Image channels -> (internal format, pixel format, swizzle)
+formats = {
+    1: (gl.R8, gl.RED, (gl.RED, gl.RED, gl.RED, gl.ONE)),
+    2: (gl.RG8, gl.RG, (gl.RED, gl.RED, gl.RED, gl.GREEN)),
+    3: (gl.RGB8, gl.RGB, None),
+    4: (gl.RGBA8, gl.RGBA, None),
+}
+# PIL modes without a direct upload format
+conversions = {
+    '1': 'L',
+    'I': 'L',
+    'I;16': 'L',
+    'F': 'L',
+    'P': 'RGBA',
+    'PA': 'RGBA',
+    'CMYK': 'RGB',
+    'YCbCr': 'RGB',
+    'LAB': 'RGB',
+    'HSV': 'RGB',
+}
+
+
+def decode(image_path):
+    '''Decodes an image into a (height, width, channels) uint8 array
+
+    Pixels come straight from PIL's buffer through ``np.asarray`` instead
+    of a Python list of per-pixel tuples.
+    '''
+    with Image.open(image_path) as image:
+        mode = conversions.get(image.mode, image.mode)
+        if mode == 'RGBA' and image.mode == 'P' and 'transparency' not in image.info:
+            mode = 'RGB'
+        if mode != image.mode:
+            image = image.convert(mode)
+        pixels = np.asarray(image, dtype=np.uint8)
+    if pixels.ndim == 2:
+        pixels = pixels[..., np.newaxis]
+    return np.ascontiguousarray(pixels)
+
+
+def mipmaps(pixels):
+    '''Full mip chain of a (height, width, channels) uint8 array
+
+    Each level averages 2x2 blocks of the previous one (a side that is
+    already 1 is averaged with itself); odd rows and columns are dropped.
+    '''
+    levels = [pixels]
+    while max(pixels.shape[:2]) > 1:
+        height, width, channels = pixels.shape
+        rows, columns = (2 if height > 1 else 1), (2 if width > 1 else 1)
+        height, width = height // rows, width // columns
+        blocks = pixels[:height * rows, :width * columns].astype(np.uint16)
+        blocks = blocks.reshape(height, rows, width, columns, channels)
+        count = rows * columns
+        pixels = ((blocks.sum(axis=(1, 3)) + count // 2) // count).astype(np.uint8)
+        levels.append(pixels)
+    return levels
+
+
+def cached(image_path, params, produce):
+    '''Arrays derived from an image, memory-mapped from disk when possible
+
+    With ``context.cache_dir`` set, the arrays returned by ``produce()``
+    are saved as ``.npy`` files keyed by the image's path, modification
+    time and size and by ``params``.  Later calls map them straight from
+    disk with no decoding.
+    '''
+    if not context.cache_dir:
+        return produce()
+    stat = os.stat(image_path)
+    key = repr((os.path.abspath(image_path), stat.st_mtime, stat.st_size, params))
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    folder = os.path.join(context.cache_dir, 'textures')
+    paths = []
+    while True:
+        path = os.path.join(folder, '{}-{}.npy'.format(digest, len(paths)))
+        if not os.path.exists(path):
+            break
+        paths.append(path)
+    if paths:
+        return [np.load(path, mmap_mode='r') for path in paths]
+    arrays = produce()
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    # Written in reverse so a complete set exists once the first file does
+    for index, array in reversed(list(enumerate(arrays))):
+        path = os.path.join(folder, '{}-{}.npy'.format(digest, index))
+        temp = '{}.{}'.format(path, os.getpid())
+        with open(temp, 'wb') as fd:
+            np.save(fd, array)
+        os.rename(temp, path)
+    return arrays
+
+
+def placeholder(target=gl.TEXTURE_2D):
+    '''Shared 1x1 grey texture bound to ``target`` while images are
+    loading; each target needs a texture of its own kind'''
+    state = State.current()
+    key = (state, target)
+    if key not in Texture.placeholders:
+        texture_id = gl.gen_textures(1)
+        state.bind_texture(target, texture_id)
+        gl.tex_parameteri(target, gl.TEXTURE_MIN_FILTER, gl.NEAREST)
+        gl.tex_parameteri(target, gl.TEXTURE_MAG_FILTER, gl.NEAREST)
+        gl.pixel_storei(gl.UNPACK_ALIGNMENT, 4)
+        pixels = np.array([128, 128, 128, 255], dtype=np.uint8)
+        if target == gl.TEXTURE_1D:
+            gl.tex_image_1d(target, 0, gl.RGBA8, 1, 0, gl.RGBA, gl.UNSIGNED_BYTE, pixels)
+        elif target in (gl.TEXTURE_3D, gl.TEXTURE_2D_ARRAY):
+            gl.tex_image_3d(target, 0, gl.RGBA8, 1, 1, 1, 0, gl.RGBA, gl.UNSIGNED_BYTE, pixels)
+        else:
+            gl.tex_image_2d(target, 0, gl.RGBA8, 1, 1, 0, gl.RGBA, gl.UNSIGNED_BYTE, pixels)
+        Texture.placeholders[key] = texture_id
+    return Texture.placeholders[key]
+
+
+class Loader(object):
+    '''Decodes images on worker threads for upload on the render thread
+
+    PIL releases the GIL while decoding, so a few threads keep new
+    assets from stalling frames.  Call ``process`` once per frame on the
+    render thread to upload whatever finished decoding; futures resolve
+    (and their callbacks run) there, once the texture is usable.
+
+    >>> loader = Loader(workers=4)
+    >>> future = Texture('brick.png').load_async(loader, callback=print)
+    >>> while win.open:
+    ...     loader.process(limit=2)
+    ...     win.cycle()
+    '''
+    shared = None
+
+    def __init__(self, workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # (texture, future, decoding) ready for upload
+        self.ready = deque()
+
+    @classmethod
+    def default(cls):
+        '''Loader shared by textures loaded without one'''
+        if cls.shared is None:
+            cls.shared = cls()
+        return cls.shared
+
+    def submit(self, texture, callback=None):
+        '''Starts decoding texture's image; returns a Future of the texture'''
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        decoding = self.executor.submit(texture.decode)
+        decoding.add_done_callback(lambda done: self.ready.append((texture, future, done)))
+        return future
+
+    def finish(self, texture, future, decoding):
+        '''Uploads one decoded image and resolves its future'''
+        error = decoding.exception()
+        if error is not None:
+            future.set_exception(error)
+            return False
+        texture.create(decoding.result())
+        future.set_result(texture)
+        return True
+
+    def process(self, limit=None):
+        '''Uploads decoded images; must run on the render thread'''
+        count = 0
+        while self.ready and (limit is None or count < limit):
+            count += self.finish(*self.ready.popleft())
+        return count
+
+    def upload(self, texture):
+        '''Uploads only ``texture``'s image, if it has been decoded'''
+        for entry in list(self.ready):
+            if entry[0] is texture:
+                self.ready.remove(entry)
+                return self.finish(*entry)
+        return False
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
 
 class Texture(object):
 
-    def __init__(self, image_path, texture_type=None, min_filter=None, mag_filter=None, wrap_r=None, wrap_s=None, wrap_t=None):
-        assert glfw.core.init(), 'Error: GLFW could not be initialized'
+    # Images at least this large upload through a pixel unpack buffer
+    unpack_threshold = 1 << 20
+    # State -> (buffer id, size) of the shared pixel unpack buffer
+    unpack_buffers = {}
+    # (State, target) -> placeholder texture id
+    placeholders = {}
+
+    def __init__(self, image_path, texture_type=None, min_filter=None, mag_filter=None, wrap_r=None, wrap_s=None, wrap_t=None, mipmaps=False):
+        '''``mipmaps`` is False, True (generated on the GPU) or 'cpu'
+        (box filtered once and kept in the decoded texture cache)'''
+        assert context.initialized(), 'Error: GLFW could not be initialized'
         self.image_path = image_path
-        texture_types = [gl.TEXTURE_1D, gl.TEXTURE_2D, gl.TEXTURE_3D]
+        texture_types = [gl.TEXTURE_1D, gl.TEXTURE_2D, gl.TEXTURE_3D, gl.TEXTURE_2D_ARRAY]
         if texture_type not in texture_types:
             texture_type = gl.TEXTURE_2D
         self.texture_type = texture_type
+        self.mipmaps = mipmaps
         self.wrap_r = gl.REPEAT if wrap_r is None else wrap_r
         self.wrap_s = gl.REPEAT if wrap_s is None else wrap_s
         self.wrap_t = gl.REPEAT if wrap_t is None else wrap_t
-        self.min_filter = gl.NEAREST if min_filter is None else min_filter
-        self.mag_filter = gl.NEAREST if mag_filter is None else mag_filter
+        if min_filter is None:
+            min_filter = gl.LINEAR_MIPMAP_LINEAR if mipmaps else gl.NEAREST
+        if mag_filter is None:
+            mag_filter = gl.LINEAR if mipmaps else gl.NEAREST
+        self.min_filter = min_filter
+        self.mag_filter = mag_filter
         self.size = None
+        # Mip level -> bytes on the GPU
+        self.levels = {}
+        self.future = None
+        self.loader = None
 
     @property
     def texture(self):
         if not hasattr(self, '_id'):
+            if self.future is None:
+                self.create(self.decode())
+            else:
+                # Other textures keep waiting for process(limit=...)
+                self.loader.upload(self)
+                if not hasattr(self, '_id'):
+                    if self.future.done():
+                        # Raises what went wrong while decoding
+                        self.future.result()
+                    return placeholder(self.texture_type)
+        return self._id
+
+    def load_async(self, loader=None, callback=None):
+        '''Decodes the image in the background
+
+        Until the upload happens ``texture`` is a placeholder.  Returns a
+        Future resolving to this texture once it is usable.
+        '''
+        if self.future is None:
+            self.loader = loader or Loader.default()
+            self.future = self.loader.submit(self, callback)
+        elif callback is not None:
+            self.future.add_done_callback(callback)
+        return self.future
+
+    def produce(self, image_path):
+        '''Decodes an image into the levels uploaded for it'''
+        pixels = decode(image_path)
+        return mipmaps(pixels) if self.mipmaps == 'cpu' else [pixels]
+
+    def decode(self):
+        '''Mip levels to upload, decoded or mapped from the on-disk cache'''
+        return cached(self.image_path, (gl.TEXTURE_2D, self.mipmaps == 'cpu'), lambda: self.produce(self.image_path))
+
+    def bind(self, unit=0):
+        '''Binds the texture to a texture unit'''
+        state = State.current()
+        state.active_texture(gl.TEXTURE0 + unit)
+        state.bind_texture(self.texture_type, self.texture)
+
+    def create(self, pixels):
+        '''Creates the GL texture from decoded pixels or a list of levels'''
+        created = not hasattr(self, '_id')
+        if created:
             self._id = gl.gen_textures(1)
-            gl.bind_texture(self.texture_type, self._id)
+        State.current().bind_texture(self.texture_type, self._id)
+        if created:
             gl.tex_parameteri(self.texture_type, gl.TEXTURE_WRAP_R, self.wrap_r)
             gl.tex_parameteri(self.texture_type, gl.TEXTURE_WRAP_S, self.wrap_s)
             gl.tex_parameteri(self.texture_type, gl.TEXTURE_WRAP_T, self.wrap_t)
             gl.tex_parameteri(self.texture_type, gl.TEXTURE_MIN_FILTER, self.min_filter)
             gl.tex_parameteri(self.texture_type, gl.TEXTURE_MAG_FILTER, self.mag_filter)
-            with Image.open(self.image_path) as image:
-                image_data = np.array(list(image.getdata()), np.uint8)
-                self.size = width, height = image.width, image.height
-                gl.tex_image_2d(self.texture_type, 0, gl.RGB, width, height, 0, gl.RGB, gl.FLOAT, image_data)
-        return self._id
+        levels = pixels if isinstance(pixels, list) else [pixels]
+        for level, pixels in enumerate(levels):
+            self.upload(pixels, level=level)
+        if self.mipmaps is True:
+            gl.generate_mipmap(self.texture_type)
+            base = levels[0]
+            layers = base.shape[0] if base.ndim == 4 else 1
+            height, width, channels = base.shape[-3:]
+            level = 0
+            while max(height, width) > 1:
+                height, width, level = max(height // 2, 1), max(width // 2, 1), level + 1
+                self.levels[level] = layers * height * width * channels
+
+    def upload(self, pixels, level=0):
+        '''Sends a (height, width, channels) uint8 array (or a stack of
+        (layers, height, width, channels)) to the bound texture'''
+        height, width, channels = pixels.shape[-3:]
+        internal_format, pixel_format, swizzle = formats[channels]
+        # Rows are only 4 byte aligned when their size is a multiple of 4
+        gl.pixel_storei(gl.UNPACK_ALIGNMENT, 4 if (width * channels) % 4 == 0 else 1)
+        data = pixels
+        if pixels.nbytes >= self.unpack_threshold:
+            data = self.stage(pixels)
+        if pixels.ndim == 4:
+            layers = pixels.shape[0]
+            gl.tex_image_3d(self.texture_type, level, internal_format, width, height, layers, 0, pixel_format, gl.UNSIGNED_BYTE, data)
+        else:
+            gl.tex_image_2d(self.texture_type, level, internal_format, width, height, 0, pixel_format, gl.UNSIGNED_BYTE, data)
+        if data is not pixels:
+            State.current().bind_buffer(gl.PIXEL_UNPACK_BUFFER, 0)
+        if swizzle is not None:
+            gl.tex_parameteriv(self.texture_type, gl.TEXTURE_SWIZZLE_RGBA, np.array(swizzle, dtype=np.int32))
+        self.levels[level] = pixels.nbytes
+        if level == 0:
+            self.size = (width, height)
+
+    @property
+    def nbytes(self):
+        '''GPU memory used by every mip level'''
+        return sum(self.levels.values())
+
+    def delete(self):
+        '''Frees the GL texture; using ``texture`` again recreates it'''
+        if hasattr(self, '_id'):
+            State.current().unbind_texture(self._id)
+            gl.delete_textures([self._id])
+            del self._id
+            self.levels.clear()
+
+    def stage(self, pixels):
+        '''Copies pixels into the shared unpack buffer and returns its offset
+
+        The buffer is orphaned on every upload so the driver never waits
+        for the previous transfer.
+        '''
+        state = State.current()
+        buffer_id, size = Texture.unpack_buffers.get(state, (None, 0))
+        if buffer_id is None:
+            buffer_id = gl.gen_buffers(1)
+        state.bind_buffer(gl.PIXEL_UNPACK_BUFFER, buffer_id)
+        size = max(size, pixels.nbytes)
+        gl.buffer_data(gl.PIXEL_UNPACK_BUFFER, size, None, gl.STREAM_DRAW)
+        gl.buffer_sub_data(gl.PIXEL_UNPACK_BUFFER, 0, pixels.nbytes, pixels)
+        Texture.unpack_buffers[state] = (buffer_id, size)
+        return ctypes.c_void_p(0)
 
     def __repr__(self):
         cname = self.__class__.__name__
@@ -47,3 +360,139 @@ class Texture(object):
             size = ' ({}, {})'.format(*self.size)
         string = '<{cname}:{texture_id} {image_path}{size}>'.format(**locals())
         return string
+
+
+class TextureArray(Texture):
+    '''Same-sized images packed into the layers of one GL_TEXTURE_2D_ARRAY
+
+    One bind serves every image, so a set of materials can be drawn in a
+    single instanced or batched call that picks a layer per instance.
+
+    >>> materials = TextureArray(['brick.png', 'stone.png'], mipmaps=True)
+    >>> materials.bind(unit=0)
+    >>> layers = np.array([materials.layers[m] for m in names], dtype='f4')
+    >>> program.draw_instanced(model=transforms, layer=layers, materials=0)
+
+    The fragment shader samples ``texture(materials, vec3(uv, layer))``
+    from a ``uniform sampler2DArray materials``.
+    '''
+
+    def __init__(self, image_paths, **kwds):
+        self.image_paths = list(image_paths)
+        assert self.image_paths, 'A TextureArray needs at least one image'
+        self.layers = OrderedDict((path, index) for index, path in enumerate(self.image_paths))
+        kwds['texture_type'] = gl.TEXTURE_2D_ARRAY
+        Texture.__init__(self, self.image_paths[0], **kwds)
+
+    def decode(self):
+        '''Levels of every image stacked into (layers, height, width, channels)'''
+        chains = [
+            cached(path, (gl.TEXTURE_2D, self.mipmaps == 'cpu'), lambda path=path: self.produce(path))
+            for path in self.image_paths
+        ]
+        shapes = set(chain[0].shape for chain in chains)
+        assert len(shapes) == 1, 'TextureArray images must share size and channels: {}'.format(sorted(shapes))
+        return [np.stack(level) for level in zip(*chains)]
+
+    def __repr__(self):
+        cname = self.__class__.__name__
+        texture_id = self.texture
+        layers = len(self.image_paths)
+        size = ''
+        if self.size:
+            size = ' ({}, {})'.format(*self.size)
+        string = '<{cname}:{texture_id} layers={layers}{size}>'.format(**locals())
+        return string
+
+
+def _nbytes(levels):
+    '''Host memory held by decoded pixels or a list of mip levels'''
+    levels = levels if isinstance(levels, list) else [levels]
+    return sum(level.nbytes for level in levels)
+
+
+class Residency(object):
+    '''Keeps textures within a GPU memory budget
+
+    Binding through the manager makes a texture resident, evicting the
+    least recently bound textures once ``budget`` bytes are exceeded.
+    Decoded pixels stay in a CPU-side cache of at most ``host_budget``
+    bytes (``budget`` by default), so evicted textures are usually
+    re-uploaded without decoding again.  ``hits``, ``misses`` and
+    ``evictions`` count what happened.
+
+    >>> residency = Residency(budget=512 * 1024 * 1024)
+    >>> for texture, mesh in sprites:
+    ...     residency.bind(texture, unit=0)
+    ...     program.draw(mesh=mesh)
+    '''
+
+    def __init__(self, budget=256 * 1024 * 1024, host_budget=None):
+        self.budget = budget
+        self.host_budget = budget if host_budget is None else host_budget
+        # Resident textures, least recently bound first
+        self.resident = OrderedDict()
+        # Texture -> decoded mip levels, least recently used first
+        self.cache = OrderedDict()
+        self.cached = 0
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bind(self, texture, unit=0):
+        '''Makes texture resident and binds it to a texture unit'''
+        if texture in self.resident and hasattr(texture, '_id'):
+            self.hits += 1
+            # Most recently bound goes last
+            self.resident[texture] = self.resident.pop(texture)
+        else:
+            self.misses += 1
+            texture.create(self.pixels(texture))
+            self.used += texture.nbytes - self.resident.pop(texture, 0)
+            self.resident[texture] = texture.nbytes
+            self.evict(keep=texture)
+        state = State.current()
+        state.active_texture(gl.TEXTURE0 + unit)
+        state.bind_texture(texture.texture_type, texture.texture)
+        return texture.texture
+
+    def pixels(self, texture):
+        '''Decoded levels of texture, from the CPU-side cache if there'''
+        if texture in self.cache:
+            levels = self.cache[texture] = self.cache.pop(texture)
+            return levels
+        levels = texture.decode()
+        self.cache[texture] = levels
+        self.cached += _nbytes(levels)
+        # Least recently used first, but never what was just decoded
+        for other in list(self.cache):
+            if self.cached <= self.host_budget or other is texture:
+                break
+            self.cached -= _nbytes(self.cache.pop(other))
+        return levels
+
+    def evict(self, keep=None):
+        '''Frees least recently bound textures until within budget'''
+        for texture in list(self.resident):
+            if self.used <= self.budget:
+                break
+            if texture is keep:
+                continue
+            self.used -= self.resident.pop(texture)
+            texture.delete()
+            self.evictions += 1
+
+    def forget(self, texture):
+        '''Stops managing texture, freeing its GL and CPU copies'''
+        self.used -= self.resident.pop(texture, 0)
+        if texture in self.cache:
+            self.cached -= _nbytes(self.cache.pop(texture))
+        texture.delete()
+
+    def __repr__(self):
+        cname = self.__class__.__name__
+        used, budget = self.used, self.budget
+        hits, misses, evictions = self.hits, self.misses, self.evictions
+        string = '<{cname} {used}/{budget} bytes hits={hits} misses={misses} evictions={evictions}>'.format(**locals())
+        return string
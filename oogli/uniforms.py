@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from glfw import gl
+import numpy as np
+
+from .buffers import Buffer, DirtyArray
+from .state import State
+from .utils import uniform_types
+
+
+class Uniform(object):
+    '''A uniform location bound to its typed GL setter
+
+    The location and setter are resolved once when the program is built.
+    Calling the uniform uploads a value only if it differs from the last
+    value uploaded to this program; numpy arrays of the right dtype are
+    passed to OpenGL as-is, without a copy.  Array uniforms take every
+    element in one call, e.g. a (64, 4) array for ``vec4 lights[64]``.
+
+    >>> mvp = np.eye(4, dtype=np.float32)
+    >>> program.uniforms['mvp'](mvp)  # uploads
+    True
+    >>> program.uniforms['mvp'](mvp)  # unchanged, skipped
+    False
+    '''
+
+    def __init__(self, program_id, name, vartype, size=1, location=None):
+        self.name = name
+        self.vartype = vartype
+        self.size = size
+        if location is None:
+            location = gl.get_uniform_location(program_id, name)
+        self.location = location
+        self.dtype = uniform_types[vartype].dtype
+        self.setter = self.compile(self.location, vartype)
+        self.value = None
+        self.uploads = 0
+        self.skipped = 0
+
+    @staticmethod
+    def compile(location, vartype):
+        '''Returns a setter taking a numpy array for ``vartype``'''
+        uniform_type = uniform_types[vartype]
+        mapping, components = uniform_type.setter, uniform_type.components
+        if uniform_type.matrix:
+            def setter(value, mapping=mapping, location=location, components=components):
+                mapping(location, value.size // components, gl.FALSE, value)
+        else:
+            def setter(value, mapping=mapping, location=location, components=components):
+                mapping(location, value.size // components, value)
+        return setter
+
+    def reset(self):
+        '''Forgets the cached value so the next call always uploads'''
+        self.value = None
+
+    def __call__(self, data):
+        value = np.ascontiguousarray(data, dtype=self.dtype)
+        cached = self.value
+        if cached is not None and cached.shape == value.shape:
+            if np.array_equal(cached, value):
+                self.skipped += 1
+                return False
+            np.copyto(cached, value)
+        else:
+            self.value = value.copy()
+        if self.location != -1:
+            self.setter(value)
+        self.uploads += 1
+        return True
+
+    def __repr__(self):
+        cname = self.__class__.__name__
+        name = self.name
+        vartype = self.vartype
+        location = self.location
+        string = '<{cname}:{location} {vartype} {name}>'.format(**locals())
+        return string
+
+
+def std140(dtype):
+    '''Pads a numpy structured dtype out to the std140 block layout
+
+    The last axis of each field is its vector (1-4 components); any leading
+    axes are array elements, each padded to a vec4 stride.  A 1-D field
+    longer than four is an array of scalars.  Matrices are arrays of
+    column vectors, so ``('view', 'f4', (4, 4))`` is a mat4 and
+    ``('lights', 'f4', (64, 3))`` a ``vec3 lights[64]``.
+
+    >>> std140([('color', 'f4', 3), ('scale', 'f4')]).fields['scale'][1]
+    12
+    >>> std140([('scale', 'f4'), ('color', 'f4', 3)]).fields['color'][1]
+    16
+    '''
+    dtype = np.dtype(dtype)
+    names, formats, offsets = [], [], []
+    offset = 0
+    for name in dtype.names:
+        field = dtype.fields[name][0]
+        base, shape = field.base, field.shape
+        if base.names is not None or base.itemsize not in (4, 8):
+            raise TypeError('Unsupported std140 field: {} {}'.format(name, field))
+        if len(shape) == 1 and shape[0] > 4:
+            elements, components = shape, 1
+        else:
+            elements, components = shape[:-1], (shape[-1:] or (1,))[0]
+        if components > 4:
+            raise TypeError('Vectors have at most four components: {} {}'.format(name, field))
+        align = base.itemsize * (1, 2, 4, 4)[components - 1]
+        if elements:
+            # Array (and matrix column) strides round up to a vec4
+            align = max(align, 16)
+            padded = align // base.itemsize
+            formats.append((base, tuple(elements) + (padded, )))
+            size = int(np.prod(elements)) * align
+        else:
+            formats.append((base, shape))
+            size = base.itemsize * components
+        offset = (offset + align - 1) // align * align
+        names.append(name)
+        offsets.append(offset)
+        offset += size
+    itemsize = (offset + 15) // 16 * 16
+    return np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': itemsize})
+
+
+class UniformBlock(object):
+    '''A uniform buffer object shared by every program declaring the block
+
+    Blocks are registered by name and given a process-wide binding point.
+    Programs link their block of the same name to that binding point when
+    built, so data set here is uploaded once (and only when it changed)
+    no matter how many programs read it.  Declare the block in GLSL with
+    ``layout(std140)`` so its layout matches.
+
+    >>> camera = UniformBlock('Camera', [('view', 'f4', (4, 4)), ('eye', 'f4', 3)])
+    >>> camera['view'] = np.eye(4)
+    >>> camera['eye'] = (0.0, 0.0, 5.0)
+    >>> program.draw()  # uploads camera once for this frame
+    '''
+    registry = {}
+    bindings = {}
+
+    @classmethod
+    def binding_point(cls, name):
+        '''Returns the binding point shared by all blocks called ``name``'''
+        if name not in cls.bindings:
+            cls.bindings[name] = len(cls.bindings)
+        return cls.bindings[name]
+
+    def __init__(self, name, dtype, usage=gl.DYNAMIC_DRAW):
+        self.name = name
+        self.dtype = std140(dtype)
+        self.usage = usage
+        self.binding = UniformBlock.binding_point(name)
+        self.data = np.zeros(1, dtype=self.dtype).view(DirtyArray)
+        self.buffer = None
+        # Index into each field that skips std140 padding
+        self.indices = {}
+        source = np.dtype(dtype)
+        for key in source.names:
+            shape = source.fields[key][0].shape
+            if self.dtype.fields[key][0].shape == shape:
+                self.indices[key] = (0, )
+            elif len(shape) == 1:
+                self.indices[key] = (0, Ellipsis, 0)
+            else:
+                self.indices[key] = (0, Ellipsis, slice(0, shape[-1]))
+        UniformBlock.registry[name] = self
+
+    def __getitem__(self, key):
+        return self.data[key][self.indices[key]]
+
+    def __setitem__(self, key, val):
+        self.data[key][self.indices[key]] = val
+
+    def __contains__(self, key):
+        return key in self.indices
+
+    def __iter__(self):
+        for key in self.indices:
+            yield key
+
+    def upload(self):
+        '''Sends modified data to the GPU; a no-op when nothing changed'''
+        if self.buffer is None:
+            self.buffer = Buffer(gl.gen_buffers(1), self.data)
+            self.buffer.upload(gl.UNIFORM_BUFFER, self.usage)
+            State.current().bind_buffer_base(gl.UNIFORM_BUFFER, self.binding, self.buffer.id)
+        else:
+            self.buffer.upload(gl.UNIFORM_BUFFER, self.usage)
+
+    def delete(self):
+        if self.buffer is not None:
+            gl.delete_buffers(1, [self.buffer.id])
+            State.current().reset()
+            self.buffer = None
+        UniformBlock.registry.pop(self.name, None)
+
+    def __repr__(self):
+        cname = self.__class__.__name__
+        name = self.name
+        binding = self.binding
+        fields = ', '.join(self.indices)
+        string = '<{cname}:{binding} {name} [{fields}]>'.format(**locals())
+        return string
@@ -1,38 +1,122 @@
-import glfw
+from collections import namedtuple
+import re
+
 from glfw import gl
 import numpy as np
 
+from . import context
+from .state import State
+
 
 def screenshot(win, pixels=None):
-    width, height = win.width, win.height
+    '''Reads the pixels of a Window or Framebuffer, waiting for rendering
+    to finish
+
+    Windows are read at their framebuffer size, which differs from the
+    window size on HiDPI displays.  Use a Readback to capture every frame
+    without stalling.
+    '''
+    if hasattr(win, 'read'):
+        return win.read(pixels)
+    width, height = win.fb_width, win.fb_height
     if not isinstance(pixels, np.ndarray):
-        shape = (width, height, 3)
+        shape = (height, width, 3)
         pixels = np.zeros(shape, dtype=np.uint8)
+    State.current().bind_framebuffer(gl.READ_FRAMEBUFFER, 0)
+    gl.pixel_storei(gl.PACK_ALIGNMENT, 1)
     return gl.read_pixels(0, 0, width, height, gl.RGB, gl.UNSIGNED_BYTE, pixels)
 
 
 def opengl_supported(major, minor):
     '''Determines if opengl is supported for the version provided'''
-    assert glfw.core.init() != 0
-    version = (major, minor)
-    glfw.core.window_hint(glfw.CONTEXT_VERSION_MAJOR, major)
-    glfw.core.window_hint(glfw.CONTEXT_VERSION_MINOR, minor)
-    profile = glfw.OPENGL_ANY_PROFILE if version < (3, 2) else glfw.OPENGL_CORE_PROFILE
-    glfw.core.window_hint(glfw.OPENGL_PROFILE, profile)
-    # Setup forward compatibility if able
-    forward_compat = gl.FALSE if version < (3, 0) else gl.TRUE
-    glfw.core.window_hint(glfw.OPENGL_FORWARD_COMPAT, forward_compat)
-    #  Keep the window invisible
-    glfw.core.window_hint(glfw.VISIBLE, gl.FALSE)
-    glfw.core.window_hint(glfw.FOCUSED, gl.FALSE)
-    win = glfw.create_window(title='test', width=1, height=1)
-    return win is not None
-
-# TODO:  Fill this out or automate it.
-uniform_mapping = {
-    'vec1': gl.uniform_1f,
-    'vec2': gl.uniform_2f,
-    'vec3': gl.uniform_3f,
-    'vec4': gl.uniform_4f,
-    'mat4': gl.uniform_matrix_4fv,
-}
+    return context.supported(major, minor)
+
+UniformType = namedtuple('UniformType', ['dtype', 'components', 'matrix', 'setter'])
+
+
+def _uniform_types():
+    '''Generates every GLSL uniform type along with its numpy dtype,
+    component count and the array (``*v``) variant of its glUniform call.
+
+    All setters take a count, so a ``uniform vec4 lights[64]`` is uploaded
+    from one (64, 4) array with a single ``glUniform4fv``.
+    '''
+    # prefix: (dtype, glUniform suffix)
+    kinds = {
+        '': (np.float32, 'f'),
+        'd': (np.float64, 'd'),
+        'i': (np.int32, 'i'),
+        'u': (np.uint32, 'ui'),
+        'b': (np.int32, 'i'),
+    }
+    scalars = {'float': '', 'double': 'd', 'int': 'i', 'uint': 'u', 'bool': 'b'}
+    types = {}
+    for name, prefix in scalars.items():
+        dtype, suffix = kinds[prefix]
+        types[name] = UniformType(dtype, 1, False, getattr(gl, 'glUniform1{}v'.format(suffix)))
+    for prefix, (dtype, suffix) in kinds.items():
+        for size in (1, 2, 3, 4):
+            if size == 1 and prefix:
+                # vec1 is kept for backwards compatibility only
+                continue
+            setter = getattr(gl, 'glUniform{}{}v'.format(size, suffix))
+            types['{}vec{}'.format(prefix, size)] = UniformType(dtype, size, False, setter)
+    for prefix in ('', 'd'):
+        dtype, suffix = kinds[prefix]
+        for columns in (2, 3, 4):
+            for rows in (2, 3, 4):
+                shape = '{}x{}'.format(columns, rows) if columns != rows else '{}'.format(columns)
+                setter = getattr(gl, 'glUniformMatrix{}{}v'.format(shape, suffix))
+                uniform_type = UniformType(dtype, columns * rows, True, setter)
+                types['{}mat{}x{}'.format(prefix, columns, rows)] = uniform_type
+                if columns == rows:
+                    types['{}mat{}'.format(prefix, columns)] = uniform_type
+    # Samplers and images are bound to texture units with integers
+    samplers = [
+        '1D', '2D', '3D', 'Cube', '2DRect', '1DArray', '2DArray',
+        'CubeArray', 'Buffer', '2DMS', '2DMSArray',
+    ]
+    shadows = ['1DShadow', '2DShadow', 'CubeShadow', '2DRectShadow', '1DArrayShadow', '2DArrayShadow', 'CubeArrayShadow']
+    for prefix in ('', 'i', 'u'):
+        for sampler in samplers:
+            for kind in ('sampler', 'image'):
+                types['{}{}{}'.format(prefix, kind, sampler)] = UniformType(np.int32, 1, False, gl.glUniform1iv)
+    for sampler in shadows:
+        types['sampler{}'.format(sampler)] = UniformType(np.int32, 1, False, gl.glUniform1iv)
+    return types
+
+
+def _glsl_enum(name):
+    '''Returns the OpenGL type enum of a GLSL type name, if there is one
+
+    >>> _glsl_enum('mat2x3') == gl.GL_FLOAT_MAT2x3
+    True
+    >>> _glsl_enum('usamplerCubeArray') == gl.UNSIGNED_INT_SAMPLER_CUBE_MAP_ARRAY
+    True
+    '''
+    prefixes = {'i': 'INT_', 'u': 'UNSIGNED_INT_', 'b': 'BOOL_', 'd': 'DOUBLE_', '': 'FLOAT_'}
+    scalars = {'float': 'FLOAT', 'double': 'DOUBLE', 'int': 'INT', 'uint': 'UNSIGNED_INT', 'bool': 'BOOL'}
+    if name in scalars:
+        enum = scalars[name]
+    else:
+        match = re.match(r'^(?P<prefix>[iubd]?)(?P<kind>vec|mat|sampler|image)(?P<shape>\w+)$', name)
+        if match is None:
+            return None
+        prefix, kind, shape = match.group('prefix', 'kind', 'shape')
+        shape = shape.replace('CubeArray', 'CubeMapArray').replace('MS', 'Multisample')
+        shape = re.sub(r'(?<=.)([A-Z][a-z])', r'_\1', shape).upper()
+        if kind in ('vec', 'mat'):
+            enum = '{}{}{}'.format(prefixes[prefix], kind.upper(), shape.replace('X', 'x'))
+        else:
+            enum = '{}{}_{}'.format(prefixes[prefix] if prefix else '', kind.upper(), shape)
+    return getattr(gl, 'GL_{}'.format(enum), None)
+
+
+uniform_types = _uniform_types()
+uniform_mapping = {name: uniform_type.setter for name, uniform_type in uniform_types.items()}
+# OpenGL type enums, as reported by reflection, to GLSL type names
+uniform_names = dict(
+    (_glsl_enum(name), name)
+    for name in sorted(uniform_types, key=len, reverse=True)
+    if _glsl_enum(name) is not None
+)
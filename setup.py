@@ -81,9 +81,12 @@ class PyTest(TestCommand):
 install_requires = [
     'cffi',
     'glfw-cffi',
-    'numpy',
+    'numpy>=1.13',
     'pillow',
 ]
+if sys.version_info < (3, 2):
+    # Backport of concurrent.futures
+    install_requires.append('futures')
 
 tests_require = [
     'pytest',
@@ -1,6 +1,14 @@
 import pytest
 
 
+@pytest.fixture(autouse=True)
+def requested_versions(request):
+    '''Keeps versions requested by one test's shaders out of the next'''
+    from oogli import context
+    context.requested.clear()
+    request.addfinalizer(context.requested.clear)
+
+
 @pytest.fixture(scope="module")
 def options():
     '''Captures configuration data from config file and validates that
@@ -23,3 +31,17 @@ def options():
     }
 
     return options
+
+
+@pytest.fixture
+def headless(request):
+    '''A current 64x48 headless Context; skips unless PYOPENGL_PLATFORM
+    is egl or osmesa'''
+    import os
+    if os.environ.get('PYOPENGL_PLATFORM') not in ('egl', 'osmesa'):
+        pytest.skip('Needs a headless context (PYOPENGL_PLATFORM=egl or osmesa)')
+    import oogli
+
+    ctx = oogli.Context(width=64, height=48)
+    request.addfinalizer(ctx.delete)
+    return ctx
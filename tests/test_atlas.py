@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_skyline():
+    '''Tests that packed rectangles stay on the page and never overlap'''
+    import random
+    import numpy as np
+    from oogli.atlas import Skyline
+
+    random.seed(0)
+    skyline = Skyline(64, 64)
+    coverage = np.zeros((64, 64), dtype=int)
+    placed = 0
+    for _ in range(200):
+        width, height = random.randint(1, 12), random.randint(1, 12)
+        position = skyline.insert(width, height)
+        if position is None:
+            continue
+        x, y = position
+        assert x + width <= 64 and y + height <= 64
+        coverage[y:y + height, x:x + width] += 1
+        placed += 1
+    assert placed > 40
+    assert coverage.max() == 1
+    assert sum(segment[2] for segment in skyline.segments) == 64
+    assert skyline.insert(65, 1) is None
+
+
+def test_atlas(headless, tmpdir):
+    '''Tests packing, UV rectangles and reuse of a saved layout'''
+    import json
+    import os
+    import numpy as np
+    from PIL import Image
+    import oogli
+    from oogli import gl
+
+    paths = []
+    for index, (width, height) in enumerate([(16, 10), (12, 30), (30, 30), (8, 8)]):
+        path = str(tmpdir.join('{}.png'.format(index)))
+        Image.fromarray(np.full((height, width, 3), index * 10 + 10, dtype=np.uint8)).save(path)
+        paths.append(path)
+    layout = str(tmpdir.join('atlas.json'))
+    atlas = oogli.Atlas(paths, size=32, layout=layout)
+    assert os.path.exists(layout)
+    assert atlas.pages == 2
+    region = atlas.regions[paths[1]]
+    assert (region.width, region.height) == (12, 30)
+    assert region.uv == (region.x / 32.0, region.y / 32.0, (region.x + 12) / 32.0, (region.y + 30) / 32.0)
+
+    atlas.bind(unit=0)
+    assert atlas.size == (32, 32)
+    gl.pixel_storei(gl.PACK_ALIGNMENT, 1)
+    pages = gl.get_tex_image(gl.TEXTURE_2D_ARRAY, 0, gl.RGBA, gl.UNSIGNED_BYTE)
+    pages = np.frombuffer(pages, dtype=np.uint8).reshape(2, 32, 32, 4)
+    for index, path in enumerate(paths):
+        page, x, y, width, height, _ = atlas.regions[path]
+        # Including the padding, which repeats the edges
+        assert (pages[page, y - 1:y + height + 1, x - 1:x + width + 1] == [index * 10 + 10] * 3 + [255]).all()
+
+    # A matching layout is read back instead of packed again
+    with open(layout) as fd:
+        data = json.load(fd)
+    data['regions'][paths[3]] = [1, 20, 20, 8, 8]
+    with open(layout, 'w') as fd:
+        json.dump(data, fd)
+    reused = oogli.Atlas(paths, size=32, layout=layout)
+    assert reused.regions[paths[3]][:5] == (1, 20, 20, 8, 8)
+    # A different page size invalidates it
+    repacked = oogli.Atlas(paths, size=64, layout=layout)
+    assert repacked.pages == 1
+
+    # So do damaged layout files
+    for damaged in ('{"stamp": ', json.dumps({'stamp': repacked.stamp(paths)})):
+        with open(layout, 'w') as fd:
+            fd.write(damaged)
+        repacked = oogli.Atlas(paths, size=64, layout=layout)
+        assert repacked.regions == oogli.Atlas(paths, size=64).regions
+        with open(layout) as fd:
+            assert 'regions' in json.load(fd)
+
+
+if __name__ == '__main__':
+    pytest.main()
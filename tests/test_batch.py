@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_batch_draw_id(headless):
+    '''Tests that batched meshes draw in one call with their own uniforms'''
+    import oogli
+    from oogli import gl
+
+    program = oogli.Program('''
+        #version 330
+        uniform vec3 color[2];
+        in vec2 vertices;
+        in float draw_id;
+        out vec3 v_color;
+        void main () {
+            gl_Position = vec4(vertices, 0.0, 1.0);
+            v_color = color[int(draw_id)];
+        }
+    ''', '''
+        #version 330
+        in vec3 v_color;
+        out vec4 frag_color;
+        void main () {
+            frag_color = vec4(v_color, 1.0);
+        }
+    ''')
+    # Quads covering the left and right thirds of the frame
+    left = program.setup(vertices=[(-1.0, -1.0), (-0.4, -1.0), (-0.4, 1.0), (-1.0, 1.0)], indices=[0, 1, 2, 0, 2, 3])
+    right = program.setup(vertices=[(0.4, -1.0), (1.0, -1.0), (1.0, 1.0), (0.4, 1.0)], indices=[0, 1, 2, 0, 2, 3])
+    batch = program.batch([left, right])
+    assert len(batch) == 2
+    assert list(batch.base_vertices) == [0, 4]
+
+    headless.framebuffer.clear()
+    batch.draw(mode=gl.TRIANGLES, fill=gl.FILL, color=[(1.0, 0.0, 0.0), (0.0, 0.0, 1.0)])
+    pixels = oogli.screenshot(headless)
+    assert (pixels[:, :16] == (255, 0, 0)).all()
+    assert (pixels[:, -16:] == (0, 0, 255)).all()
+    assert (pixels[:, 24:40] == 0).all()
+    batch.delete()
+    program.delete()
+
+
+if __name__ == '__main__':
+    pytest.main()
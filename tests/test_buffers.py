@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_dirty_array_tracking():
+    '''Tests that only modified byte ranges are marked for upload'''
+    import numpy as np
+    from oogli.buffers import DirtyArray
+
+    dtype = [('vertices', np.float32, 2), ('colors', np.float32, 3)]
+    data = np.zeros(8, dtype=dtype).view(DirtyArray)
+    assert data.dirty == (0, data.nbytes)
+
+    data.clean()
+    assert data.dirty is None
+
+    # Field view of a single row
+    data['colors'][2] = (1.0, 1.0, 1.0)
+    assert data.dirty == (2 * 20 + 8, 3 * 20)
+
+    # Ranges grow to cover every change
+    data[5] = data[5]
+    assert data.dirty == (2 * 20 + 8, 6 * 20)
+
+    # In-place math on a view
+    data.clean()
+    data['vertices'] += 1
+    assert data.dirty == (0, 7 * 20 + 8)
+
+    # Copies track on their own
+    data.clean()
+    copy = data.copy()
+    copy.clean()
+    copy[0] = copy[1]
+    assert data.dirty is None
+    assert copy.dirty == (0, 20)
+
+    # Integer and boolean array keys copy, so the whole view is marked
+    data.clean()
+    data[[0, 5]] = data[1]
+    assert data.dirty == (0, data.nbytes)
+    data.clean()
+    data['colors'][data['vertices'][:, 0] > 10] = 0.0
+    assert data.dirty == (8, data.nbytes)
+    data.clean()
+    data['vertices'][np.array([6, 7]), 1] = 2.0
+    assert data.dirty == (0, 7 * 20 + 8)
+
+
+def test_draw_uploads_once(headless, monkeypatch):
+    '''Tests that drawing again without new vertex data sends nothing'''
+    import oogli
+    from oogli import gl
+
+    program = oogli.Program('''
+        #version 330
+        in vec2 vertices;
+        void main () {
+            gl_Position = vec4(vertices, 0.0, 1.0);
+        }
+    ''', '''
+        #version 330
+        out vec4 frag_color;
+        void main () {
+            frag_color = vec4(1.0);
+        }
+    ''')
+    triangle = [(0.0, 1.0), (-1.0, -1.0), (1.0, -1.0)]
+    mesh = program.draw(vertices=triangle, fill=gl.FILL)
+    uploads = []
+    for name in ('buffer_data', 'buffer_sub_data'):
+        monkeypatch.setattr(gl, name, lambda *args, **kwds: uploads.append(args))
+    for _ in range(3):
+        assert program.draw(fill=gl.FILL) is mesh
+    assert uploads == []
+    mesh.data.data['vertices'][1] = (-0.5, -1.0)
+    program.draw(fill=gl.FILL)
+    assert len(uploads) == 1
+    program.delete()
+
+
+def test_draw_reuses_mesh(headless, monkeypatch):
+    '''Tests that drawing new vertex data refills or replaces one mesh'''
+    import numpy as np
+    import oogli
+    from oogli import gl
+
+    program = oogli.Program('''
+        #version 330
+        in vec2 vertices;
+        void main () {
+            gl_Position = vec4(vertices, 0.0, 1.0);
+        }
+    ''', '''
+        #version 330
+        out vec4 frag_color;
+        void main () {
+            frag_color = vec4(1.0);
+        }
+    ''')
+    triangle = [(0.0, 1.0), (-1.0, -1.0), (1.0, -1.0)]
+    mesh = program.draw(vertices=triangle, fill=gl.FILL)
+    generated = []
+    gen_buffers = gl.gen_buffers
+    monkeypatch.setattr(gl, 'gen_buffers', lambda count: generated.append(count) or gen_buffers(count))
+    for step in range(50):
+        moved = [(x, y + step / 100.0) for x, y in triangle]
+        assert program.draw(vertices=moved, fill=gl.FILL) is mesh
+    assert generated == []
+    assert list(program.meshes.values()) == [mesh]
+    assert np.allclose(mesh.data.data['vertices'][0], (0.0, 1.49))
+
+    # A different length needs new buffers; the old mesh is freed
+    deleted = []
+    monkeypatch.setattr(mesh, 'delete', lambda: deleted.append(mesh))
+    square = program.draw(vertices=triangle + [(1.0, 1.0)], indices=[0, 1, 2, 0, 2, 3], fill=gl.FILL)
+    assert square is not mesh
+    assert deleted == [mesh]
+    assert list(program.meshes.values()) == [square]
+    program.delete()
+
+
+def test_vertex_view(tmpdir):
+    '''Tests that buffers are viewed in place as interleaved or planar vertices'''
+    import array
+    import numpy as np
+    from oogli.buffers import Pointer, vertex_view
+
+    layout = [('vertices', 'f4', 2), ('colors', 'u1', 4)]
+    records = np.zeros(5, dtype=layout)
+    records['vertices'] = np.arange(10).reshape(5, 2)
+
+    # Interleaved records
+    for data in (records, memoryview(records), bytearray(records.tobytes())):
+        view, attributes, count = vertex_view(data, layout)
+        assert count == 5
+        assert (view['vertices'] == records['vertices']).all()
+        assert attributes['colors'] == Pointer(np.dtype('u1'), 4, 12, 8, True)
+    view, _, _ = vertex_view(records, layout)
+    records['vertices'][0] = (7, 7)
+    assert tuple(view['vertices'][0]) == (7, 7)
+
+    # Planar blocks from a memory-mapped file and an array.array
+    path = str(tmpdir.join('planar.bin'))
+    planar = np.concatenate([records['vertices'].ravel().view('u1'), records['colors'].ravel()])
+    planar.tofile(path)
+    for data in (np.memmap(path, mode='r'), array.array('B', planar.tobytes())):
+        view, attributes, count = vertex_view(data, layout, planar=True)
+        assert count == 5
+        assert attributes['vertices'] == Pointer(np.dtype('f4'), 2, 8, 0, False)
+        assert attributes['colors'] == Pointer(np.dtype('u1'), 4, 4, 40, True)
+        assert np.shares_memory(view, np.frombuffer(data, dtype='u1'))
+
+    with pytest.raises(AssertionError):
+        vertex_view(bytes(13), layout, planar=True)
+    _, attributes, _ = vertex_view(records, layout, normalized={'colors': False})
+    assert not attributes['colors'].normalized
+
+
+def test_vertex_types(headless):
+    '''Tests normalized colours, integer inputs and narrow indices'''
+    import array
+    import numpy as np
+    import oogli
+    from oogli import gl
+
+    program = oogli.Program('''
+        #version 330
+        in vec2 vertices;
+        in vec4 colors;
+        in ivec2 steps;
+        flat out ivec2 step;
+        out vec4 color;
+        void main () {
+            gl_Position = vec4(vertices, 0.0, 1.0);
+            color = colors;
+            step = steps;
+        }
+    ''', '''
+        #version 330
+        flat in ivec2 step;
+        in vec4 color;
+        out vec4 frag_color;
+        void main () {
+            frag_color = vec4(color.rg, float(step.x - step.y) / 255.0, 1.0);
+        }
+    ''')
+    layout = [('vertices', 'f4', 2), ('colors', 'u1', 4), ('steps', 'i4', 2)]
+    records = np.zeros(3, dtype=layout)
+    records['vertices'] = [(-1.0, -1.0), (3.0, -1.0), (-1.0, 3.0)]
+    records['colors'] = (128, 64, 0, 255)
+    records['steps'] = (1000, 968)
+    indices = array.array('H', [0, 1, 2])
+    mesh = program.setup(data=records, layout=layout, indices=indices)
+    # 16 bit indices are drawn as they are
+    assert np.shares_memory(mesh.indices.data, np.frombuffer(indices, dtype=np.uint16))
+    assert mesh.index_type == gl.UNSIGNED_SHORT
+    headless.framebuffer.clear()
+    program.draw(mesh=mesh, fill=gl.FILL)
+    assert (oogli.screenshot(headless) == (128, 64, 32)).all()
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_record_and_replay(headless):
+    '''Tests replaying, patching uniforms and the shadow state afterwards'''
+    import oogli
+    from oogli import gl
+
+    program = oogli.Program('''
+        #version 330
+        in vec2 vertices;
+        void main () {
+            gl_Position = vec4(vertices, 0.0, 1.0);
+        }
+    ''', '''
+        #version 330
+        uniform vec3 color;
+        out vec4 frag_color;
+        void main () {
+            frag_color = vec4(color, 1.0);
+        }
+    ''')
+    quad = [0, 1, 2, 0, 2, 3]
+    left = program.setup(vertices=[(-1.0, -1.0), (-0.4, -1.0), (-0.4, 1.0), (-1.0, 1.0)], indices=quad)
+    right = program.setup(vertices=[(0.4, -1.0), (1.0, -1.0), (1.0, 1.0), (0.4, 1.0)], indices=quad)
+    red, green, blue = (1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)
+
+    def colors():
+        pixels = oogli.screenshot(headless)
+        return tuple(pixels[24, 8]), tuple(pixels[24, -8])
+
+    # Leaves blue as the uniform's last uploaded value
+    program.draw(mesh=left, fill=gl.FILL, color=blue)
+
+    commands = oogli.CommandList()
+    commands.call(gl.clear, gl.COLOR_BUFFER_BIT | gl.DEPTH_BUFFER_BIT)
+    handle = commands.draw(program, mesh=left, fill=gl.FILL, color=red)
+    commands.draw(program, mesh=right, fill=gl.FILL, color=blue)
+    # The second draw shares the first one's program and polygon state
+    assert [func for func, _ in commands.commands].count(gl.use_program) == 1
+
+    headless.framebuffer.clear()
+    commands.replay()
+    assert colors() == ((255, 0, 0), (0, 0, 255))
+
+    # Through the handle of one draw
+    handle['color'][:] = green
+    commands.replay()
+    assert colors() == ((0, 255, 0), (0, 0, 255))
+
+    # Through replay keywords, for every draw
+    commands.replay(color=blue)
+    assert colors() == ((0, 0, 255), (0, 0, 255))
+
+    # The shadow state matches what the replay left bound
+    state = oogli.State.current()
+    assert state.values['program'] == (gl.get_integerv(gl.CURRENT_PROGRAM), )
+    assert state.values['vertex_array'] == (gl.get_integerv(gl.VERTEX_ARRAY_BINDING), )
+    assert state.values['vertex_array'] == (right.vao, )
+    # Immediate draws afterwards bind and upload what they need
+    headless.framebuffer.clear()
+    commands.replay(color=red)
+    headless.framebuffer.clear()
+    program.draw(mesh=left, fill=gl.FILL, color=blue)
+    program.draw(mesh=right, fill=gl.FILL, color=red)
+    assert colors() == ((0, 0, 255), (255, 0, 0))
+    program.delete()
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_shaders_record_required_version():
+    '''Tests that shaders register their version without creating windows'''
+    from oogli import context
+    from oogli.shaders import VertexShader
+
+    created = []
+    create_window = context.glfw.create_window
+    context.glfw.create_window = lambda *args, **kwds: created.append(args) or create_window(*args, **kwds)
+    try:
+        shader = VertexShader('''
+            #version 410
+            in vec2 vertices;
+            void main () {
+                gl_Position = vec4(vertices, 0.0, 1.0);
+            }
+        ''')
+    finally:
+        context.glfw.create_window = create_window
+    assert shader.version == (4, 1)
+    assert (4, 1) in context.requested
+    assert context.required() >= (4, 1)
+    assert created == []
+    # The next context claims the request; later ones start over
+    assert context.claim() == (4, 1)
+    assert context.required() is None
+
+
+def test_probe_once_per_version():
+    '''Tests that support for a version is probed only once'''
+    from oogli import context
+
+    major, minor = (3, 2)
+    first = context.supported(major, minor)
+    key = (major, minor, context.profile((major, minor)))
+    assert context.probes[key] == first
+    context.probes[key] = 'cached'
+    try:
+        assert context.supported(major, minor) == 'cached'
+    finally:
+        context.probes[key] = first
+
+
+def test_highest_version_from_disk(tmpdir):
+    '''Tests that a persisted version skips probing in a new process'''
+    from oogli import context
+
+    cache_dir = context.cache_dir
+    probes = dict(context.probes)
+    context.cache_dir = str(tmpdir)
+    try:
+        context.save({'driver': 'vendor | renderer | 4.1', 'version': [4, 1]})
+        context.probes.clear()
+        assert context.highest((3, 3)) == (4, 1)
+        assert context.probes == {(4, 1, context.profile((4, 1))): True}
+        context.save(None)
+        assert context.load() is None
+    finally:
+        context.cache_dir = cache_dir
+        context.probes.clear()
+        context.probes.update(probes)
+
+
+def test_stale_version_on_disk(tmpdir, monkeypatch):
+    '''Tests that a remembered version the driver refuses is dropped'''
+    import sys
+    import oogli
+    from oogli import context
+
+    window_module = sys.modules['oogli.Window']
+
+    class Core(object):
+        @staticmethod
+        def init():
+            return 1
+
+    class Glfw(object):
+        core = Core
+
+    attempts = []
+    monkeypatch.setattr(window_module, 'glfw', Glfw)
+    monkeypatch.setattr(oogli.Window, 'create', staticmethod(lambda *args: attempts.append(args[3:5])))
+    monkeypatch.setattr(context, 'supported', lambda major, minor, profile_type=None: (major, minor) <= (3, 3))
+    monkeypatch.setattr(context, 'cache_dir', str(tmpdir))
+    monkeypatch.setattr(context, 'probes', {})
+    context.save({'driver': 'vendor | renderer | 4.5', 'version': [4, 5]})
+    with pytest.raises(RuntimeError):
+        oogli.Window(major=3, minor=2)
+    # The record was tried, forgotten and replaced by probing
+    assert attempts == [(4, 5), (3, 3)]
+    assert context.load() is None
+    assert context.probes == {}
+
+
+def test_headless_context(headless):
+    '''Tests rendering and reading back without a window'''
+    import oogli
+    from oogli import gl
+
+    program = oogli.Program('''
+        #version 330
+        in vec2 vertices;
+        void main () {
+            gl_Position = vec4(vertices, 0.0, 1.0);
+        }
+    ''', '''
+        #version 330
+        uniform vec4 color;
+        out vec4 frag_color;
+        void main () {
+            frag_color = color;
+        }
+    ''')
+    headless.framebuffer.clear()
+    triangle = [(0.0, 1.0), (-1.0, -1.0), (1.0, -1.0)]
+    program.draw(vertices=triangle, fill=gl.FILL, color=(0.0, 1.0, 0.0, 1.0))
+    pixels = oogli.screenshot(headless)
+    assert pixels.shape == (48, 64, 3)
+    assert pixels[..., 0].max() == 0
+    assert 0.4 < (pixels[..., 1] == 255).mean() < 0.6
+    program.delete()
+
+
+if __name__ == '__main__':
+    pytest.main()
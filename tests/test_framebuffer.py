@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_framebuffer_target(headless):
+    '''Tests rendering into a Framebuffer and restoring previous bindings'''
+    import oogli
+    from oogli import gl
+
+    program = oogli.Program('''
+        #version 330
+        in vec2 vertices;
+        void main () {
+            gl_Position = vec4(vertices, 0.0, 1.0);
+        }
+    ''', '''
+        #version 330
+        out vec4 frag_color;
+        void main () {
+            frag_color = vec4(0.0, 1.0, 0.0, 1.0);
+        }
+    ''')
+    state = oogli.State.current()
+    headless.framebuffer.clear((0.0, 0.0, 1.0, 1.0))
+    target = oogli.Framebuffer(32, 16)
+    with target:
+        target.clear()
+        program.draw(vertices=[(-1.0, -1.0), (3.0, -1.0), (-1.0, 3.0)], fill=gl.FILL)
+    # Drawing and viewport go back to the context's own framebuffer
+    assert state.values[('framebuffer', gl.DRAW_FRAMEBUFFER)][-1] == headless.framebuffer.fbo
+    assert state.values['viewport'] == (0, 0, headless.width, headless.height)
+
+    pixels = target.read()
+    assert pixels.shape == (16, 32, 3)
+    assert (pixels == (0, 255, 0)).all()
+    # Reading the target leaves the previous read framebuffer bound
+    assert state.values[('framebuffer', gl.READ_FRAMEBUFFER)][-1] == headless.framebuffer.fbo
+    assert (oogli.screenshot(headless) == (0, 0, 255)).all()
+
+    # Deleting the target leaves the context's framebuffer bound
+    state.bind_texture(gl.TEXTURE_2D, target.color)
+    target.delete()
+    assert state.values[('framebuffer', gl.DRAW_FRAMEBUFFER)][-1] == headless.framebuffer.fbo
+    assert state.values[('framebuffer', gl.READ_FRAMEBUFFER)][-1] == headless.framebuffer.fbo
+    assert not any(key[0] == 'texture' for key in state.values if isinstance(key, tuple))
+    headless.framebuffer.clear()
+    program.draw(vertices=[(-1.0, -1.0), (3.0, -1.0), (-1.0, 3.0)], fill=gl.FILL)
+    assert (oogli.screenshot(headless) == (0, 255, 0)).all()
+    program.delete()
+
+
+if __name__ == '__main__':
+    pytest.main()
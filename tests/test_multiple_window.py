@@ -66,13 +66,11 @@ def test_multiple_windows(options):
 
     # while win1.open or win2.open:
     #     if win1.open:
-    #         win1.focus = True
+    #         win1.make_current()
     #         program.draw(mode=win1.mode, fill=win1.fill, color=color.next())
     #         win1.cycle()
-    #         win1.focus = False
     #     if win2.open:
-    #         win2.focus = True
+    #         win2.make_current()
     #         program.draw(mode=win2.mode, fill=win2.fill, color=color.next())
     #         win2.cycle()
-    #         win2.focus = False
     #     break
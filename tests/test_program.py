@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_program_binary_cache(headless, tmpdir, monkeypatch):
+    '''Tests that a second build links from the cached program binary'''
+    import os
+    import struct
+    import oogli
+    from oogli import context, gl
+
+    vshader = '''
+        #version 330
+        in vec2 vertices;
+        void main () {
+            gl_Position = vec4(vertices, 0.0, 1.0);
+        }
+    '''
+    fshader = '''
+        #version 330
+        uniform vec4 color;
+        out vec4 frag_color;
+        void main () {
+            frag_color = color;
+        }
+    '''
+    monkeypatch.setattr(context, 'cache_dir', str(tmpdir))
+    loaded = []
+    load_binary = oogli.Program.load_binary
+    monkeypatch.setattr(oogli.Program, 'load_binary', lambda self, path: loaded.append(load_binary(self, path)) or loaded[-1])
+
+    first = oogli.Program(vshader, fshader)
+    first.build()
+    paths = tmpdir.join('programs').listdir()
+    assert len(paths) == 1
+    first.delete()
+
+    second = oogli.Program(vshader, fshader)
+    second.build()
+    assert loaded == [False, True]
+    assert list(second.uniforms) == ['color']
+    assert list(second.inputs) == ['vertices']
+    second.delete()
+
+    # Truncated files are a miss and get rewritten
+    paths[0].write_binary(b'\x01')
+    third = oogli.Program(vshader, fshader)
+    third.build()
+    assert loaded == [False, True, False]
+    assert os.path.getsize(str(paths[0])) > 4
+    third.delete()
+
+    # So are binaries in a format the driver does not know
+    blob = paths[0].read_binary()
+    paths[0].write_binary(struct.pack('<I', 0xdeadbeef) + blob[4:])
+    fourth = oogli.Program(vshader, fshader)
+    fourth.build()
+    assert loaded == [False, True, False, False]
+    assert paths[0].read_binary() == blob
+    headless.framebuffer.clear()
+    fourth.draw(vertices=[(-1.0, -1.0), (3.0, -1.0), (-1.0, 3.0)], color=(0.0, 1.0, 0.0, 1.0), fill=gl.FILL)
+    assert (oogli.screenshot(headless) == (0, 255, 0)).all()
+    fourth.delete()
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_readback_ring(headless):
+    '''Tests that reads lag depth - 1 frames behind through the ring'''
+    import numpy as np
+    import oogli
+    from oogli import gl
+
+    depth = 3
+    readback = oogli.Readback(headless.width, headless.height, depth=depth)
+    frames = []
+    for frame in range(6):
+        headless.framebuffer.clear((frame / 10.0, 0.0, 0.0, 1.0))
+        pixels = readback.read()
+        if frame < depth - 1:
+            # The ring is still filling
+            assert pixels is None
+            continue
+        assert pixels.shape == (headless.height, headless.width, 4)
+        frames.append(int(pixels[0, 0, 0]))
+    expected = [int(round(frame / 10.0 * 255)) for frame in range(6 - (depth - 1))]
+    assert frames == expected
+
+    # ``out`` keeps a copy past the next read
+    out = np.zeros((headless.height, headless.width, 4), dtype=np.uint8)
+    headless.framebuffer.clear((1.0, 0.0, 0.0, 1.0))
+    assert readback.read(out=out) is out
+    assert out[0, 0, 0] == int(round(0.4 * 255))
+    assert oogli.State.current().values[('buffer', gl.PIXEL_PACK_BUFFER)] == (gl.PIXEL_PACK_BUFFER, 0)
+    readback.delete()
+
+
+if __name__ == '__main__':
+    pytest.main()
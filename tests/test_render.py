@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+vshader = '''
+    #version 330
+    in vec2 vertices;
+    void main () {
+        gl_Position = vec4(vertices, 0.0, 1.0);
+    }
+'''
+fshader = '''
+    #version 330
+    uniform vec4 color;
+    out vec4 frag_color;
+    void main () {
+        frag_color = color;
+    }
+'''
+
+
+def test_render_many(headless):
+    '''Tests that every job lands in its own frame'''
+    import oogli
+
+    jobs = [dict(color=(0.0, green / 4.0, 0.0, 1.0)) for green in range(5)]
+    frames = oogli.render_many((vshader, fshader), jobs, workers=2, width=16, height=8,
+                               vertices=[(-1.0, -1.0), (3.0, -1.0), (-1.0, 3.0)])
+    assert frames.shape == (5, 8, 16, 3)
+    for green, frame in enumerate(frames):
+        assert (frame == (0, int(round(green / 4.0 * 255)), 0)).all()
+
+
+def test_render_many_setup_error(headless):
+    '''Tests that a worker failing to build raises instead of respawning'''
+    import oogli
+
+    broken = fshader.replace('frag_color = color;', 'frag_color = colour;')
+    with pytest.raises(Exception) as error:
+        oogli.render_many((vshader, broken), [dict(color=(1.0, 0.0, 0.0, 1.0))] * 4, workers=2, width=16, height=8,
+                          vertices=[(-1.0, -1.0), (3.0, -1.0), (-1.0, 3.0)])
+    assert 'Worker setup failed' in str(error.value)
+
+
+if __name__ == '__main__':
+    pytest.main()
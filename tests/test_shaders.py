@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_shared_shaders():
+    '''Tests that identical sources share one reference counted Shader'''
+    from oogli.shaders import Shader, VertexShader, FragmentShader
+
+    source = '''
+        #version 410
+        in vec2 vertices;
+        void main () {
+            gl_Position = vec4(vertices, 0.0, 1.0);
+        }
+    '''
+    first = VertexShader.acquire(source)
+    # Indentation and blank lines do not change the source
+    second = VertexShader.acquire('\n'.join('  ' + line for line in source.split('\n')))
+    assert first is second
+    assert first.references == 2
+    # Other stages with the same text are different shaders
+    other = FragmentShader.acquire(source)
+    assert other is not first
+    first.release()
+    assert (VertexShader, first.source) in Shader.registry
+    second.release()
+    other.release()
+    assert (VertexShader, first.source) not in Shader.registry
+    assert (FragmentShader, other.source) not in Shader.registry
+    assert VertexShader.acquire(source) is not first
+    Shader.registry.clear()
+
+
+def test_shared_shaders_per_context(headless):
+    '''Tests that one source builds and draws in two separate contexts'''
+    import oogli
+    from oogli import gl
+
+    vshader = '''
+        #version 330
+        in vec2 vertices;
+        void main () {
+            gl_Position = vec4(vertices, 0.0, 1.0);
+        }
+    '''
+    fshader = '''
+        #version 330
+        out vec4 frag_color;
+        void main () {
+            frag_color = vec4(0.0, 1.0, 0.0, 1.0);
+        }
+    '''
+    triangle = [(0.0, 1.0), (-1.0, -1.0), (1.0, -1.0)]
+    first = oogli.Program(vshader, fshader)
+    first.build()
+    other = oogli.Context(width=64, height=48)
+    try:
+        second = oogli.Program(vshader, fshader)
+        assert second.vert is first.vert
+        second.build()
+        other.framebuffer.clear()
+        second.draw(vertices=triangle, fill=gl.FILL)
+        assert 0.4 < (oogli.screenshot(other)[..., 1] == 255).mean() < 0.6
+        assert len(second.vert.ids) == 2
+        second.delete()
+    finally:
+        other.delete()
+    headless.make_current()
+    headless.framebuffer.clear()
+    first.draw(vertices=triangle, fill=gl.FILL)
+    assert 0.4 < (oogli.screenshot(headless)[..., 1] == 255).mean() < 0.6
+    first.delete()
+
+
+def test_delete_in_owning_context(headless):
+    '''Tests that GL names are freed only while their own context is current'''
+    import oogli
+    from oogli import gl
+    from oogli.shaders import Shader, VertexShader
+
+    vshader = '''
+        #version 330
+        in vec2 vertices;
+        void main () {
+            gl_Position = vec4(vertices, 0.0, 1.0);
+        }
+    '''
+    fshader = '''
+        #version 330
+        out vec4 frag_color;
+        void main () {
+            frag_color = vec4(0.0, 1.0, 0.0, 1.0);
+        }
+    '''
+    first = oogli.Program(vshader, fshader)
+    first.build()
+    program_id = first.program
+    other = oogli.Context(width=64, height=48)
+    try:
+        second = oogli.Program(vshader, fshader)
+        second.build()
+        # Deleting the first program waits for its context
+        first.delete()
+        assert gl.is_program(second.program)
+        second.delete()
+        assert Shader.registry == {}
+    finally:
+        other.delete()
+    assert (gl.delete_program, (program_id, )) in headless.state.garbage
+    headless.make_current()
+    assert not gl.is_program(program_id)
+    assert headless.state.garbage == []
+
+    # Shaders whose __init__ failed have nothing to delete
+    VertexShader.delete(object.__new__(VertexShader))
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_state_skips_redundant_calls():
+    '''Tests that the shadow state only issues calls that change state'''
+    from oogli.state import State
+
+    calls = []
+    state = State()
+    assert state.set('program', calls.append, 3)
+    assert not state.set('program', calls.append, 3)
+    assert state.set('program', calls.append, 4)
+    assert calls == [3, 4]
+    assert (state.issued, state.skipped) == (2, 1)
+
+    state.reset()
+    assert state.set('program', calls.append, 4)
+    assert calls == [3, 4, 4]
+
+
+def test_state_per_context():
+    '''Tests that each context keeps its own shadow state'''
+    from oogli.state import State
+
+    first = State.activate('first')
+    second = State.activate('second')
+    assert first is not second
+    assert State.current() is second
+    assert State.activate('first') is first
+    State.release('first')
+    State.release('second')
+    assert State.current() not in (first, second)
+
+
+def test_window_make_current(monkeypatch):
+    '''Tests that switching windows switches the shadow State with them'''
+    import sys
+    import oogli
+    from oogli.state import State
+
+    current = []
+
+    class Core(object):
+        make_context_current = staticmethod(current.append)
+
+    class Glfw(object):
+        core = Core
+
+    monkeypatch.setattr(sys.modules['oogli.Window'], 'glfw', Glfw)
+    first, second = object.__new__(oogli.Window), object.__new__(oogli.Window)
+    first.win, second.win = 'first', 'second'
+    assert first.make_current() is first
+    second.make_current()
+    assert current == ['first', 'second']
+    assert State.current() is second.state
+    first.make_current()
+    assert State.current() is first.state is not second.state
+    assert current == ['first', 'second', 'first']
+    State.release('first')
+    State.release('second')
+    # Nothing to destroy
+    del first.win, second.win
+
+
+def test_framebuffer_bindings(monkeypatch):
+    '''Tests that binding both framebuffer targets shadows each of them'''
+    from oogli import state as state_module
+    from oogli.state import State
+
+    gl = state_module.gl
+    calls = []
+    monkeypatch.setattr(gl, 'bind_framebuffer', lambda *args: calls.append(args))
+    state = State()
+    assert state.bind_framebuffer(gl.FRAMEBUFFER, 7)
+    assert not state.bind_framebuffer(gl.READ_FRAMEBUFFER, 7)
+    assert not state.bind_framebuffer(gl.DRAW_FRAMEBUFFER, 7)
+    assert state.bind_framebuffer(gl.READ_FRAMEBUFFER, 0)
+    # Only the read target changed, so rebinding both must be issued
+    assert state.bind_framebuffer(gl.FRAMEBUFFER, 7)
+    assert calls == [(gl.FRAMEBUFFER, 7), (gl.READ_FRAMEBUFFER, 0), (gl.FRAMEBUFFER, 7)]
+
+
+if __name__ == '__main__':
+    pytest.main()
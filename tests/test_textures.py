@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_decode_modes(tmpdir):
+    '''Tests that images decode to (height, width, channels) uint8 arrays'''
+    import numpy as np
+    from PIL import Image
+    from oogli.textures import decode, formats
+
+    pixels = np.arange(7 * 5 * 4, dtype=np.uint8).reshape(7, 5, 4)
+    for mode, channels in (('L', 1), ('LA', 2), ('RGB', 3), ('RGBA', 4)):
+        path = str(tmpdir.join('{}.png'.format(mode)))
+        image = pixels[..., 0] if channels == 1 else pixels[..., :channels]
+        Image.fromarray(np.ascontiguousarray(image), mode).save(path)
+        decoded = decode(path)
+        assert decoded.shape == (7, 5, channels)
+        assert decoded.dtype == np.uint8
+        assert decoded.flags.c_contiguous
+        assert (decoded == pixels[..., :channels]).all()
+        assert channels in formats
+    # Palette images are expanded
+    path = str(tmpdir.join('P.png'))
+    Image.fromarray(pixels[..., :3]).convert('P').save(path)
+    assert decode(path).shape == (7, 5, 3)
+
+
+def test_mipmaps():
+    '''Tests the CPU box filtered mip chain'''
+    import numpy as np
+    from oogli.textures import mipmaps
+
+    pixels = np.zeros((4, 6, 1), dtype=np.uint8)
+    pixels[:2, :2] = 4
+    pixels[0, 0] = 8
+    levels = mipmaps(pixels)
+    assert [level.shape for level in levels] == [(4, 6, 1), (2, 3, 1), (1, 1, 1)]
+    assert levels[1][0, 0, 0] == 5
+    assert levels[1][1, 2, 0] == 0
+    # Odd columns are dropped, a height of 1 is kept
+    assert [level.shape[:2] for level in mipmaps(np.zeros((1, 5, 3), dtype=np.uint8))] == [(1, 5), (1, 2), (1, 1)]
+
+
+def test_decoded_cache(tmpdir):
+    '''Tests that decoded pixels are memory-mapped from the cache'''
+    import os
+    import numpy as np
+    from PIL import Image
+    from oogli import context
+    from oogli.textures import cached, decode
+
+    path = str(tmpdir.join('image.png'))
+    Image.fromarray(np.arange(48, dtype=np.uint8).reshape(4, 4, 3)).save(path)
+    calls = []
+
+    def produce():
+        calls.append(path)
+        return [decode(path)]
+
+    cache_dir = context.cache_dir
+    context.cache_dir = str(tmpdir.join('cache'))
+    try:
+        first, = cached(path, ('params', ), produce)
+        second, = cached(path, ('params', ), produce)
+        assert isinstance(second, np.memmap)
+        assert (first == second).all()
+        assert len(calls) == 1
+        # Other upload parameters and newer images are decoded again
+        cached(path, ('other', ), produce)
+        assert len(calls) == 2
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+        cached(path, ('params', ), produce)
+        assert len(calls) == 3
+    finally:
+        context.cache_dir = cache_dir
+
+
+def test_load_async(headless, tmpdir):
+    '''Tests that a placeholder is used until the decoded image is uploaded'''
+    import numpy as np
+    from PIL import Image
+    import oogli
+    from oogli.textures import Loader, placeholder
+
+    path = str(tmpdir.join('image.png'))
+    Image.fromarray(np.zeros((4, 4, 3), dtype=np.uint8)).save(path)
+    loader = Loader(workers=1)
+    try:
+        texture, other = oogli.Texture(path), oogli.Texture(path)
+        ready = []
+        future = texture.load_async(loader, callback=ready.append)
+        other.load_async(loader)
+        # Decoding finishes off-thread, uploading waits for the render thread
+        loader.executor.submit(lambda: None).result()
+        assert len(loader.ready) == 2
+        assert not future.done()
+        assert ready == []
+        assert texture.texture != placeholder()
+        assert future.result() is texture
+        assert ready == [future]
+        assert texture.size == (4, 4)
+        # Using one texture does not upload the others
+        assert len(loader.ready) == 1
+        assert loader.process(limit=1) == 1
+        assert other.size == (4, 4)
+    finally:
+        loader.shutdown()
+
+
+def test_residency_budget(headless, tmpdir):
+    '''Tests least recently bound textures are evicted to stay in budget'''
+    import numpy as np
+    from PIL import Image
+    import oogli
+
+    textures = []
+    for index in range(3):
+        path = str(tmpdir.join('{}.png'.format(index)))
+        Image.fromarray(np.full((8, 8, 4), index, dtype=np.uint8)).save(path)
+        textures.append(oogli.Texture(path))
+    # Room for two 8x8 RGBA textures
+    residency = oogli.Residency(budget=2 * 8 * 8 * 4)
+    first, second, third = textures
+    residency.bind(first)
+    residency.bind(second)
+    residency.bind(first)
+    assert (residency.hits, residency.misses, residency.evictions) == (1, 2, 0)
+    residency.bind(third)
+    # second was bound least recently
+    assert list(residency.resident) == [first, third]
+    assert not hasattr(second, '_id')
+    assert residency.used == 2 * 8 * 8 * 4
+    residency.bind(second)
+    assert (residency.hits, residency.misses, residency.evictions) == (1, 4, 2)
+    assert second.size == (8, 8)
+
+    # Decoded pixels are capped too, least recently used first
+    residency = oogli.Residency(budget=2 * 8 * 8 * 4, host_budget=8 * 8 * 4)
+    residency.bind(first)
+    residency.bind(second)
+    assert list(residency.cache) == [second]
+    assert residency.cached == 8 * 8 * 4
+    residency.forget(second)
+    assert residency.cached == 0
+
+
+def test_texture_array(headless, tmpdir):
+    '''Tests that same-sized images become layers of one texture'''
+    import numpy as np
+    from PIL import Image
+    import oogli
+    from oogli import gl
+
+    paths = []
+    for index in range(3):
+        path = str(tmpdir.join('{}.png'.format(index)))
+        Image.fromarray(np.full((8, 4, 4), index * 10, dtype=np.uint8)).save(path)
+        paths.append(path)
+    textures = oogli.TextureArray(paths, mipmaps=True)
+    textures.bind(unit=1)
+    assert textures.layers[paths[2]] == 2
+    assert textures.size == (4, 8)
+    # Base level plus a generated chain of 4x2, 2x1 and 1x1 per layer
+    assert textures.nbytes == 3 * 4 * (32 + 8 + 2 + 1)
+    gl.pixel_storei(gl.PACK_ALIGNMENT, 1)
+    pixels = gl.get_tex_image(gl.TEXTURE_2D_ARRAY, 3, gl.RGBA, gl.UNSIGNED_BYTE)
+    pixels = np.frombuffer(pixels, dtype=np.uint8).reshape(3, 4)
+    assert (pixels[:, 0] == [0, 10, 20]).all()
+
+
+def test_texture_array_load_async(headless, tmpdir):
+    '''Tests that a loading TextureArray binds an array placeholder'''
+    import threading
+    import numpy as np
+    from PIL import Image
+    import oogli
+    from oogli import gl
+    from oogli.textures import Loader, placeholder
+
+    paths = []
+    for index in range(2):
+        path = str(tmpdir.join('{}.png'.format(index)))
+        Image.fromarray(np.full((4, 4, 4), index, dtype=np.uint8)).save(path)
+        paths.append(path)
+    loader = Loader(workers=1)
+    blocked = threading.Event()
+    try:
+        # Keeps the only worker busy so the images stay undecoded
+        loader.executor.submit(blocked.wait)
+        textures = oogli.TextureArray(paths)
+        future = textures.load_async(loader)
+        textures.bind(unit=0)
+        assert textures.texture == placeholder(gl.TEXTURE_2D_ARRAY) != placeholder()
+        assert gl.get_error() == gl.NO_ERROR
+        blocked.set()
+        loader.executor.submit(lambda: None).result()
+        assert loader.process() == 1
+        assert future.result() is textures
+        textures.bind(unit=0)
+        assert textures.texture != placeholder(gl.TEXTURE_2D_ARRAY)
+    finally:
+        blocked.set()
+        loader.shutdown()
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_uniform_type_coverage():
+    '''Tests that every GLSL uniform type maps to an array setter'''
+    import numpy as np
+    from oogli import gl
+    from oogli.utils import uniform_types, uniform_mapping
+
+    expected = {
+        'float': (np.float32, 1, gl.glUniform1fv),
+        'vec4': (np.float32, 4, gl.glUniform4fv),
+        'int': (np.int32, 1, gl.glUniform1iv),
+        'ivec3': (np.int32, 3, gl.glUniform3iv),
+        'uvec2': (np.uint32, 2, gl.glUniform2uiv),
+        'bool': (np.int32, 1, gl.glUniform1iv),
+        'bvec4': (np.int32, 4, gl.glUniform4iv),
+        'mat2': (np.float32, 4, gl.glUniformMatrix2fv),
+        'mat3': (np.float32, 9, gl.glUniformMatrix3fv),
+        'mat4': (np.float32, 16, gl.glUniformMatrix4fv),
+        'mat2x3': (np.float32, 6, gl.glUniformMatrix2x3fv),
+        'sampler2D': (np.int32, 1, gl.glUniform1iv),
+        'usampler2DArray': (np.int32, 1, gl.glUniform1iv),
+        'sampler2DShadow': (np.int32, 1, gl.glUniform1iv),
+    }
+    for name, (dtype, components, setter) in expected.items():
+        uniform_type = uniform_types[name]
+        assert uniform_type.dtype == dtype, name
+        assert uniform_type.components == components, name
+        assert uniform_type.setter == setter, name
+        assert uniform_mapping[name] == setter, name
+    assert uniform_types['mat4x4'] == uniform_types['mat4']
+    assert uniform_types['mat4'].matrix
+    assert not uniform_types['vec4'].matrix
+
+
+def test_uniform_skips_unchanged(monkeypatch):
+    '''Tests uniforms upload only changed values through their own setter'''
+    import numpy as np
+    from oogli.uniforms import Uniform
+    from oogli.utils import uniform_types
+
+    calls = []
+
+    def record(location, count, *args):
+        calls.append((location, count, args[-1]))
+
+    monkeypatch.setitem(uniform_types, 'vec4', uniform_types['vec4']._replace(setter=record))
+    monkeypatch.setitem(uniform_types, 'mat4', uniform_types['mat4']._replace(setter=record))
+    # Locations are given, so no GL call is made
+    color = Uniform(0, 'color', 'vec4', location=3)
+    tint = Uniform(0, 'tint', 'vec4', location=7)
+    mvp = Uniform(0, 'mvp', 'mat4', location=1)
+
+    value = np.array([1.0, 0.5, 0.25, 1.0], dtype=np.float32)
+    assert color(value) is True
+    assert color(value) is False
+    assert color([1.0, 0.5, 0.25, 1.0]) is False
+    assert (color.uploads, color.skipped) == (1, 2)
+    # float32 input reaches the setter without a copy
+    assert calls[-1][2] is value
+    # The cache holds a copy, so changing the caller's array is noticed
+    value[0] = 0.0
+    assert color(value) is True
+    # Each uniform keeps its own location
+    assert tint((0.0, 0.0, 0.0, 1.0)) is True
+    assert mvp(np.eye(4)) is True
+    assert [(location, count) for location, count, _ in calls] == [(3, 1), (3, 1), (7, 1), (1, 1)]
+    assert calls[-1][2].dtype == np.float32
+
+    # Array uniforms take every element in one call
+    lights = Uniform(0, 'lights', 'vec4', size=8, location=9)
+    assert lights(np.zeros((8, 4), dtype=np.float32)) is True
+    assert calls[-1][:2] == (9, 8)
+    lights.reset()
+    assert lights(np.zeros((8, 4), dtype=np.float32)) is True
+
+
+def test_reflected_type_names():
+    '''Tests that reflected OpenGL type enums map back to GLSL names'''
+    from oogli import gl
+    from oogli.utils import uniform_names
+
+    assert uniform_names[gl.FLOAT] == 'float'
+    assert uniform_names[gl.FLOAT_VEC3] == 'vec3'
+    assert uniform_names[gl.FLOAT_MAT4] == 'mat4'
+    assert uniform_names[gl.GL_FLOAT_MAT2x3] == 'mat2x3'
+    assert uniform_names[gl.UNSIGNED_INT_VEC2] == 'uvec2'
+    assert uniform_names[gl.BOOL] == 'bool'
+    assert uniform_names[gl.SAMPLER_2D] == 'sampler2D'
+    assert uniform_names[gl.SAMPLER_2D_SHADOW] == 'sampler2DShadow'
+    assert uniform_names[gl.INT_SAMPLER_CUBE_MAP_ARRAY] == 'isamplerCubeArray'
+
+
+def test_std140_layout():
+    '''Tests std140 offsets and padding for a uniform block dtype'''
+    import numpy as np
+    from oogli.uniforms import std140, UniformBlock
+
+    dtype = std140([
+        ('view', np.float32, (4, 4)),
+        ('eye', np.float32, 3),
+        ('lights', np.float32, (4, 3)),
+        ('weights', np.float32, 6),
+        ('normal', np.float32, (3, 3)),
+        ('count', np.int32),
+    ])
+    offsets = {name: dtype.fields[name][1] for name in dtype.names}
+    assert offsets == {
+        'view': 0,
+        'eye': 64,
+        'lights': 80,
+        'weights': 144,
+        'normal': 240,
+        'count': 288,
+    }
+    assert dtype.itemsize == 304
+
+    # A vec3 followed by a float packs into the same vec4
+    assert std140([('eye', 'f4', 3), ('scale', 'f4')]).fields['scale'][1] == 12
+
+    # Blocks hide the padding when reading and writing fields
+    block = UniformBlock('TestLights', [('lights', np.float32, (4, 3)), ('count', np.int32)])
+    block['lights'] = np.ones((4, 3))
+    block['count'] = 4
+    assert block['lights'].shape == (4, 3)
+    assert block['count'] == 4
+    assert block.binding == UniformBlock.binding_point('TestLights')
+
+
+if __name__ == '__main__':
+    pytest.main()